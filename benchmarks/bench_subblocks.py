@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+
+from multiprocessing_pipeline import Assembler, Processor, QueueData, QueueMsg
+
+
+def get_payload(n_bytes):
+    if n_bytes < 1024:
+        return bytes(n_bytes)
+    else:
+        return np.zeros(n_bytes, dtype=np.uint8)
+
+
+def find_start_time(x):
+    '''
+    earliest source timestamp of a value, joined values are dicts of source values
+    '''
+    if isinstance(x, dict):
+        if 'start_time' in x:
+            return x['start_time']
+        return min(find_start_time(v) for v in x.values())
+    raise Exception(f'no start_time in {type(x)}')
+
+
+class BenchJoinAssembler(Assembler):
+    '''
+    joins values of input_names by index into dicts {input name: value}, every joined index is output,
+    unlike DummyMultipleSkipAssembler no index is dropped, so the sink receives every item
+    '''
+    def __init__(self, name, msg_queue, input_queue, output_queue, input_names):
+        Assembler.__init__(self, name, msg_queue, input_queue, output_queue)
+        self.input_names = input_names
+        self.values = dict()
+
+    def process_queue_els(self, els):
+        result = []
+        for el in els:
+            if isinstance(el, QueueData):
+                values = self.values.setdefault(el.index, dict())
+                values[el.name] = el.value
+                if len(values) == len(self.input_names):
+                    result.append(QueueData(name=self.name, index=el.index, value=self.values.pop(el.index)))
+        return result
+
+
+class BenchSourceProcessor(Processor):
+    def __init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue, n_items, payload_bytes, fps=None):
+        Processor.__init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue)
+        self.n_items = n_items
+        self.payload = get_payload(payload_bytes)
+        self.period = None if fps is None else 1 / fps
+        self.index = -1
+        self.next_time = None
+
+    def process_value(self):
+        if self.index + 1 >= self.n_items:
+            time.sleep(0.1)
+            return None
+        if self.period is not None:
+            if self.next_time is None:
+                self.next_time = time.perf_counter()
+            delay = self.next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time += self.period
+        self.index += 1
+        return self.index, {'start_time': time.perf_counter(), 'payload': self.payload}
+
+
+class BenchSinkProcessor(Processor):
+    def __init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue, results_queue):
+        Processor.__init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue)
+        self.results_queue = results_queue
+
+    def process_value(self, x):
+        if isinstance(x, QueueMsg):
+            return None
+        now = time.perf_counter()
+        self.results_queue.put((now, now - find_start_time(x)))
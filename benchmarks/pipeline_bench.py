@@ -0,0 +1,184 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import time
+
+import numpy as np
+
+import multiprocessing_pipeline
+from multiprocessing_pipeline import Block, Pipeline
+from multiprocessing_pipeline import NoSkipAssembler, DummyProcessor, DummyDissembler
+
+from .bench_subblocks import BenchJoinAssembler, BenchSourceProcessor, BenchSinkProcessor
+
+
+TOPOLOGIES = ('chain', 'fanout_fanin', 'wide')
+TRANSPORTS = ('queue', 'shm', 'ring')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--topologies', nargs='+', default=list(TOPOLOGIES), choices=TOPOLOGIES)
+    parser.add_argument('--transports', nargs='+', default=['queue'], choices=TRANSPORTS)
+    parser.add_argument('--payload_bytes', nargs='+', type=int, default=[16, 1 << 16, 1 << 20, 1 << 23])
+    parser.add_argument('--n_items', type=int, default=500)
+    parser.add_argument('--fps', type=float, default=None, help='source rate, as fast as possible by default')
+    parser.add_argument('--depth', type=int, default=3, help='number of pass-through blocks of chain')
+    parser.add_argument('--width', type=int, default=4, help='number of branches of wide')
+    parser.add_argument('--timeout', type=float, default=5, help='seconds without results to stop waiting')
+    parser.add_argument('--output', default=None, help='json filepath')
+    args = parser.parse_args()
+    return args
+
+
+def build_pipeline(topology, transport, args, payload_bytes, results_queue):
+    '''
+    chain: source -> b0 -> ... -> sink
+    fanout_fanin: like k4a -> vino -> fit_pose with k4a also sent directly to fit_pose
+    wide: source -> w0, ..., wn -> sink
+    '''
+    if transport == 'shm':
+        p = Pipeline(shm_slots=64, shm_slot_size=max(payload_bytes + 4096, 1 << 16))
+    elif transport == 'ring':
+        p = Pipeline(ring_queues=True, ring_size=max(4 * payload_bytes, 1 << 22))
+    else:
+        p = Pipeline()
+
+    if topology == 'chain':
+        names = [f'b{i}' for i in range(args.depth)]
+        p.add_block(Block('source', use_assembler=False, use_dissembler=False))
+        p.set_outputs('source', names[:1])
+        for name, output_name in zip(names, names[1:] + ['sink']):
+            p.add_block(Block(name, use_dissembler=False))
+            p.set_outputs(name, [output_name])
+        joins = dict()
+        n_expected = args.n_items
+    elif topology == 'fanout_fanin':
+        p.add_block(Block('source', use_assembler=False))
+        p.set_outputs('source', ['vino', 'fit_pose'])
+        p.add_block(Block('vino', use_dissembler=False))
+        p.set_outputs('vino', ['fit_pose'])
+        p.add_block(Block('fit_pose', use_dissembler=False))
+        p.set_outputs('fit_pose', ['sink'])
+        names = ['vino', 'fit_pose']
+        joins = {'fit_pose': ['source', 'vino']}
+        n_expected = args.n_items
+    elif topology == 'wide':
+        names = [f'w{i}' for i in range(args.width)]
+        p.add_block(Block('source', use_assembler=False))
+        p.set_outputs('source', names)
+        for name in names:
+            p.add_block(Block(name, use_dissembler=False))
+            p.set_outputs(name, ['sink'])
+        joins = dict()
+        n_expected = args.n_items * args.width
+    else:
+        raise Exception(f'unknown topology {topology}')
+    p.add_block(Block('sink', use_dissembler=False))
+
+    p.check_connections()
+    p.create_queues()
+    p.set_processor('source', BenchSourceProcessor, n_items=args.n_items, payload_bytes=payload_bytes, fps=args.fps)
+    if p.blocks['source'].use_dissembler:
+        p.set_dissembler('source', DummyDissembler)
+    for name in names:
+        if name in joins:
+            p.set_assembler(name, BenchJoinAssembler, input_names=joins[name])
+        else:
+            p.set_assembler(name, NoSkipAssembler)
+        p.set_processor(name, DummyProcessor)
+    p.set_assembler('sink', NoSkipAssembler)
+    p.set_processor('sink', BenchSinkProcessor, results_queue=results_queue)
+    return p, n_expected
+
+
+def get_peak_rss_mb(pids):
+    result = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        result += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return result
+
+
+def run(topology, transport, payload_bytes, args):
+    results_queue = multiprocessing.Queue()
+    p, n_expected = build_pipeline(topology, transport, args, payload_bytes, results_queue)
+    rusage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start_time = time.perf_counter()
+    p.start()
+
+    results = []
+    while len(results) < n_expected:
+        try:
+            results.append(results_queue.get(timeout=args.timeout))
+        except queue.Empty:
+            break
+    pids = [v.pid for v in multiprocessing.active_children()]
+    peak_rss_mb = get_peak_rss_mb(pids)
+    p.terminate()
+    rusage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    result = {
+        'topology': topology,
+        'transport': transport,
+        'payload_bytes': payload_bytes,
+        'n_items': args.n_items,
+        'n_expected': n_expected,
+        'n_received': len(results),
+        'n_processes': len(pids),
+        'cpu_seconds': (rusage_end.ru_utime - rusage_start.ru_utime) + (rusage_end.ru_stime - rusage_start.ru_stime),
+        'peak_rss_mb': peak_rss_mb,
+    }
+    if len(results) > 1:
+        end_times, latencies = map(np.array, zip(*results))
+        latencies = latencies * 1000
+        result.update({
+            'throughput_fps': (len(results) - 1) / (end_times[-1] - end_times[0]),
+            'latency_ms_p50': float(np.percentile(latencies, 50)),
+            'latency_ms_p90': float(np.percentile(latencies, 90)),
+            'latency_ms_p99': float(np.percentile(latencies, 99)),
+            'latency_ms_max': float(np.max(latencies)),
+        })
+    result['wall_seconds'] = time.perf_counter() - start_time
+    return result
+
+
+def main():
+    args = parse_args()
+    results = []
+    for topology in args.topologies:
+        for transport in args.transports:
+            for payload_bytes in args.payload_bytes:
+                result = run(topology, transport, payload_bytes, args)
+                results.append(result)
+                print(
+                    f'{topology:>12} {transport:>5} {payload_bytes:>9} B: '
+                    f'{result.get("throughput_fps", 0):8.1f} fps, '
+                    f'p50 {result.get("latency_ms_p50", 0):7.2f} ms, '
+                    f'p99 {result.get("latency_ms_p99", 0):7.2f} ms, '
+                    f'cpu {result["cpu_seconds"]:6.2f} s, '
+                    f'rss {result["peak_rss_mb"]:7.1f} MB, '
+                    f'received {result["n_received"]}/{result["n_expected"]}'
+                )
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': multiprocessing_pipeline.__version__,
+                'date': datetime.datetime.now().isoformat(),
+                'cpu_count': os.cpu_count(),
+                'args': vars(args),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from multiprocessing_pipeline import QueueData, RingQueue
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=2000)
+    parser.add_argument('--spin', type=int, default=10000)
+    args = parser.parse_args()
+    return args
+
+
+def echo(input_queue, output_queue, n):
+    for _ in range(n):
+        output_queue.put(input_queue.get())
+
+
+def measure(queue_factory, n, value):
+    forward_queue, backward_queue = queue_factory(), queue_factory()
+    process = multiprocessing.Process(target=echo, args=(forward_queue, backward_queue, n))
+    process.start()
+    times = []
+    for i in range(n):
+        start = time.perf_counter()
+        forward_queue.put(QueueData(name='bench', index=i, value=value))
+        backward_queue.get()
+        times.append(time.perf_counter() - start)
+    process.join()
+    for q in [forward_queue, backward_queue]:
+        if hasattr(q, 'unlink'):
+            q.unlink()
+    # one way latency is half of round trip
+    times = np.array(times[n // 10:]) / 2 * 1e6
+    return np.median(times), np.percentile(times, 99)
+
+
+def main():
+    args = parse_args()
+    queue_factories = [
+        ('multiprocessing.Queue', multiprocessing.Queue),
+        ('RingQueue spin=0', lambda: RingQueue(spin=0)),
+        (f'RingQueue spin={args.spin}', lambda: RingQueue(spin=args.spin)),
+    ]
+    for value_name, value in [('int', 1), ('64 KB ndarray', np.zeros(1 << 13))]:
+        for queue_name, queue_factory in queue_factories:
+            median, p99 = measure(queue_factory, args.n, value)
+            print(f'{value_name:>14} {queue_name:>22}: median {median:8.1f} us, p99 {p99:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import argparse
 
 
 from multiprocessing_pipeline import Block, Pipeline
-from multiprocessing_pipeline import DummySkipAssembler, DummyDissembler
+from multiprocessing_pipeline import DummySkipAssembler, DummyDissembler, ReplayProcessor, REPLAY_MODES
 from demo_subblocks import FitShapeAssembler, FitPoseAssembler
 from demo_subblocks import K4AProcessor, VINOProcessor, FitShapeProcessor, FitPoseProcessor, ResultProcessor
 from demo_subblocks import DummyDisableDissembler
@@ -11,13 +11,20 @@ from demo_subblocks import DummyDisableDissembler
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--use_kinect', action='store_true')
+    parser.add_argument('--capture_fp', type=str, default=None, help='records k4a outputs to the file')
+    parser.add_argument('--replay_fp', type=str, default=None, help='replays recorded k4a outputs instead of k4a')
+    parser.add_argument('--replay_mode', type=str, default='original', choices=REPLAY_MODES)
+    parser.add_argument('--replay_fps', type=float, default=None)
+    parser.add_argument('--replay_loop', action='store_true')
+    parser.add_argument('--control_plane', action='store_true', help='delivers messages through direct control channels')
+    parser.add_argument('--optimize', action='store_true', help='removes pass-through subblocks before start')
     args = parser.parse_args()
     return args
 
 def main():
     args = parse_args()
 
-    p = Pipeline()
+    p = Pipeline(control_plane=args.control_plane)
 
     p.add_block(Block('k4a', use_assembler=False))
     p.add_block(Block('vino'))  # detects face kps
@@ -35,7 +42,15 @@ def main():
 
     scale = 10
     
-    p.set_processor('k4a', K4AProcessor, sleep_args=(scale * 27, scale * 5), use_kinect=args.use_kinect)
+    if args.replay_fp is not None:
+        p.set_processor(
+            'k4a', ReplayProcessor, capture_fp=args.replay_fp, mode=args.replay_mode,
+            fps=args.replay_fps, replay_loop=args.replay_loop
+        )
+    else:
+        p.set_processor('k4a', K4AProcessor, sleep_args=(scale * 27, scale * 5), use_kinect=args.use_kinect)
+    if args.capture_fp is not None:
+        p.set_capture('k4a', args.capture_fp)
     p.set_dissembler('k4a', DummyDisableDissembler)
 
     p.set_assembler('vino', DummySkipAssembler)
@@ -52,6 +67,9 @@ def main():
     p.set_assembler('result', DummySkipAssembler)
     p.set_processor('result', ResultProcessor)
 
+    if args.optimize:
+        plan = p.compile()
+        print(f'removed pass-through subblocks {plan["eliminated"]}, processes {plan["processes"][0]} -> {plan["processes"][1]}')
     p.start()
 
 
@@ -1,10 +1,9 @@
 import numpy as np
-from copy import deepcopy
-from collections import defaultdict
+from copy import copy
 import time
 
 from multiprocessing_pipeline import Assembler, Processor, Dissembler
-from multiprocessing_pipeline import QueueMsg, QueueData, MetaMsg
+from multiprocessing_pipeline import QueueMsg, QueueData, MetaMsg, IndexJoin
 
 
 def get_result(x, name):
@@ -92,8 +91,8 @@ class VINOProcessor(Processor):
 class FitShapeAssembler(Assembler):
     def __init__(self, name, msg_queue, input_queue, output_queue, n_frames):
         Assembler.__init__(self, name, msg_queue, input_queue, output_queue)
-        self.input_values = defaultdict(dict)
         self.input_names = ['vino', 'k4a']
+        self.index_join = IndexJoin(self.input_names)
         self.max_index = 0
         self.n_frames = n_frames
         self.done = False
@@ -104,23 +103,17 @@ class FitShapeAssembler(Assembler):
         for el in els:
             if isinstance(el, QueueData):
                 if el.name in self.input_names:
-                    index = el.index
-                    self.input_values[index][el.name] = el.value
+                    self.index_join.add(el.name, el.index, el.value)
                 else:
                     raise Exception(str(el))
         result = []
-        indexes = list(sorted(filter(lambda k: len(self.input_values[k]) == len(self.input_names), self.input_values.keys())))
-        if len(indexes) >= self.n_frames:
+        if self.index_join.n_complete() >= self.n_frames:
             self.done = True
             print(f'collected data for {self.name}')
-            max_index = max(indexes)
-            self.max_index = max(self.max_index, max_index)
-            if max_index == self.max_index:
-                value = [deepcopy(self.input_values[k]) for k in indexes[-self.n_frames:]]
-                result.append(QueueData(name=self.name, index=max_index, value=value))
-            delete_indexes = list(filter(lambda x: x <= self.max_index, self.input_values.keys()))
-            for delete_index in delete_indexes:
-                del self.input_values[delete_index]
+            joined = self.index_join.pop_complete()[-self.n_frames:]
+            self.max_index = max(self.max_index, joined[-1][0])
+            value = [v for _, v in joined]
+            result.append(QueueData(name=self.name, index=self.max_index, value=value))
         return result
 
 
@@ -154,8 +147,9 @@ class FitShapeProcessor(Processor):
 class FitPoseAssembler(Assembler):
     def __init__(self, name, msg_queue, input_queue, output_queue):
         Assembler.__init__(self, name, msg_queue, input_queue, output_queue)
-        self.inputs = dict()
         self.input_names = ['k4a', 'vino', 'fit_shape']
+        # frames are joined after the shape is fit
+        self.index_join = IndexJoin(['k4a', 'vino'])
         self.shape_fit = False
         self.max_index = 0
         
@@ -168,26 +162,17 @@ class FitPoseAssembler(Assembler):
                     self.shape_fit = True
                 elif self.shape_fit:
                     if el.name in self.input_names:
-                        index = el.index
-                        if not index in self.inputs:
-                            self.inputs[index] = dict()
-                        self.inputs[index][el.name] = el.value
+                        self.index_join.add(el.name, el.index, el.value)
                     else:
                         raise Exception(f'subblock: {self.subblock_name}, el: {str(el)}')
         result = []
         if not self.shape_fit:
             return result
-        indexes = list(sorted(filter(lambda k: len(self.inputs[k]) == len(self.input_names) - 1, self.inputs.keys())))
-        if len(indexes) > 0:
-            max_index = max(indexes)
-            self.max_index = max(self.max_index, max_index)
-            if max_index == self.max_index:
-                result_value = deepcopy(self.inputs[max_index])
-                result_queue_el = QueueData(name=self.name, index=max_index, value=result_value)
-                result.append(result_queue_el)
-            delete_indexes = list(filter(lambda x: x <= self.max_index, self.inputs.keys()))
-            for delete_index in delete_indexes:
-                del self.inputs[delete_index]
+        joined = self.index_join.pop_latest()
+        if joined is not None:
+            index, value = joined
+            self.max_index = max(self.max_index, index)
+            result.append(QueueData(name=self.name, index=index, value=value))
         return result
 
 
@@ -230,5 +215,5 @@ class DummyDisableDissembler(Dissembler):
         else:
             result = []
             for q, enabled in zip(self.output_queues, self.enabled):
-                result.append(deepcopy(x) if enabled else None)
+                result.append(copy(x) if enabled else None)
             return result
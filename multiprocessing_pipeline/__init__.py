@@ -1,7 +1,18 @@
 from .pipeline import MetaMsg, Block, Pipeline
-from .subblocks import QueueEl, QueueData, QueueMsg
-from .subblocks import Assembler, Processor, Dissembler
-from .subblocks import SkipAssembler, NoSkipAssembler, DummySkipAssembler, DummyMultipleSkipAssembler
-from .subblocks import DummyProcessor, DummyDissembler
+from .subblocks import QueueEl, QueueData, QueueMsg, QueueSeq, REPLAY_MODES
+from .subblocks import Assembler, Processor, BatchProcessor, Dissembler
+from .subblocks import SkipAssembler, NoSkipAssembler, WindowAssembler, DummySkipAssembler, DummyMultipleSkipAssembler
+from .subblocks import ReplayProcessor, DummyProcessor, DummyDissembler, Reorderer
+from .shm import SharedMemoryPool, SharedMemoryQueue
+from .queues import BoundedQueue, Mailbox, RingQueue
+from .fused import FusedBlock
+from .control import ControlChannel, ControlRouter
+from .batch import ResultIterator
+from .capture import CaptureWriter, CaptureReader
+from .cache import ValueCache
+from .latency import LatencyHistogram
+from .demand import Demand
+from .join import IndexJoin
+from .metrics import SubBlockMetrics, MetricsServer
 
 __version__ = '0.5'
@@ -0,0 +1,55 @@
+import asyncio
+
+
+class ResultIterator:
+    '''
+    iterates over results of values submitted to a pipeline, see Pipeline.submit, map and results
+    values are submitted lazily while they are iterated, at most max_in_flight of the pipeline wait for results
+    ordered=True yields results in index order, else as they complete
+    with_index=True yields (index, result), else result
+    timeout is not None raises queue.Empty if no result was received in timeout seconds
+    supports for and async for, async iteration waits for results in a thread of the default executor
+    '''
+    def __init__(self, pipeline, values=None, ordered=True, with_index=True, timeout=None):
+        self.pipeline = pipeline
+        self.values = None if values is None else iter(values)
+        self.ordered = ordered
+        self.with_index = with_index
+        self.timeout = timeout
+
+    def submit_values(self):
+        while self.values is not None and self.pipeline.n_in_flight() < self.pipeline.max_in_flight:
+            try:
+                value = next(self.values)
+            except StopIteration:
+                self.values = None
+                break
+            self.pipeline.submit(value, timeout=self.timeout)
+
+    def get(self):
+        '''
+        returns the next (index, result) or None when nothing is left
+        '''
+        self.submit_values()
+        result = self.pipeline.pop_result(ordered=self.ordered, timeout=self.timeout)
+        if result is None:
+            return None
+        return result if self.with_index else result[1]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        result = self.get()
+        if result is None:
+            raise StopIteration
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        result = await asyncio.get_running_loop().run_in_executor(None, self.get)
+        if result is None:
+            raise StopAsyncIteration
+        return result
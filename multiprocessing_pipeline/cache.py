@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import os.path as osp
+import pickle
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from .payload import fingerprint
+
+
+def get_nbytes(x):
+    '''
+    approximate size of a value, ndarrays count their data
+    '''
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    elif isinstance(x, dict):
+        return sys.getsizeof(x) + sum(get_nbytes(k) + get_nbytes(v) for k, v in x.items())
+    elif isinstance(x, (list, tuple)):
+        return sys.getsizeof(x) + sum(get_nbytes(v) for v in x)
+    return sys.getsizeof(x)
+
+
+class NotLoaded:
+    '''
+    value of a cache entry that is stored in a file and was not loaded yet
+    '''
+    pass
+
+
+class ValueCache:
+    '''
+    least recently used results of process_value keyed by payload.fingerprint of the input value
+    at most max_items results and max_bytes of them if max_bytes is not None are kept
+    dirpath is not None stores every result in a file, results of previous runs are loaded on their first hit
+    hits and misses are counted in shared memory
+    '''
+    def __init__(self, max_items=256, max_bytes=None, dirpath=None):
+        assert max_items > 0
+        assert max_bytes is None or max_bytes > 0
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.dirpath = dirpath
+        # key -> (value, nbytes), value is NotLoaded if it was not loaded from dirpath yet
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = multiprocessing.RawValue('q', 0)
+        self.misses = multiprocessing.RawValue('q', 0)
+        if self.dirpath is not None:
+            os.makedirs(self.dirpath, exist_ok=True)
+            self.load_index()
+
+    def get_fp(self, key):
+        return osp.join(self.dirpath, f'{key.hex()}.pkl')
+
+    def load_index(self):
+        fns = [fn for fn in os.listdir(self.dirpath) if fn.endswith('.pkl')]
+        fps = sorted((osp.join(self.dirpath, fn) for fn in fns), key=osp.getmtime)
+        for fp in fps:
+            key = bytes.fromhex(osp.basename(fp)[:-len('.pkl')])
+            self.add(key, NotLoaded(), osp.getsize(fp))
+
+    def get_key(self, x):
+        return fingerprint(x)
+
+    def get(self, key):
+        '''
+        returns (True, value) on a hit, (False, None) on a miss
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses.value += 1
+            return False, None
+        self.entries.move_to_end(key)
+        value, nbytes = entry
+        if isinstance(value, NotLoaded):
+            try:
+                with open(self.get_fp(key), 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                self.remove(key)
+                self.misses.value += 1
+                return False, None
+            self.entries[key] = (value, nbytes)
+        self.hits.value += 1
+        return True, value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.remove(key)
+        if self.dirpath is not None:
+            fp = self.get_fp(key)
+            # rename is atomic, replicas could share dirpath
+            tmp_fp = f'{fp}.{os.getpid()}.tmp'
+            with open(tmp_fp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fp, fp)
+        self.add(key, value, get_nbytes(value))
+
+    def add(self, key, value, nbytes):
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while len(self.entries) > self.max_items or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes and len(self.entries) > 1
+        ):
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        _, nbytes = self.entries.pop(key)
+        self.nbytes -= nbytes
+        if self.dirpath is not None:
+            try:
+                os.remove(self.get_fp(key))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,113 @@
+import mmap
+import os
+import pickle
+import struct
+import time
+
+
+CAPTURE_MAGIC = b'MPPCAPT1'
+# magic, reserved
+FILE_HEADER_FORMAT = '<8sQ'
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)
+# record size, index, time_ns, meta size, number of buffers
+RECORD_HEADER_FORMAT = '<QqqQQ'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+# buffer offset from the record start, buffer size
+BUFFER_FORMAT = '<QQ'
+BUFFER_SIZE = struct.calcsize(BUFFER_FORMAT)
+ALIGNMENT = 64
+
+
+def align(x):
+    return (x + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class CaptureWriter:
+    '''
+    appends QueueData to a capture file, a record is a header, a buffer table, the pickled (name, value)
+    and out-of-band pickle buffers of contiguous ndarrays aligned to 64 bytes, so CaptureReader returns them zero-copy
+    every record is flushed, a record cut by a crash is ignored by CaptureReader
+    '''
+    def __init__(self, fp):
+        self.f = open(fp, 'ab')
+        if self.f.tell() == 0:
+            self.f.write(struct.pack(FILE_HEADER_FORMAT, CAPTURE_MAGIC, 0))
+        self.position = self.f.tell()
+        self.n_records = 0
+
+    def write(self, name, index, value, time_ns=None):
+        if time_ns is None:
+            time_ns = time.time_ns()
+        buffers = []
+        meta = pickle.dumps((name, value), protocol=5, buffer_callback=buffers.append)
+        buffers = [v.raw() for v in buffers]
+        offset = RECORD_HEADER_SIZE + BUFFER_SIZE * len(buffers) + len(meta)
+        table = []
+        for buffer in buffers:
+            # buffers are aligned in the file, not only in the record
+            offset = align(self.position + offset) - self.position
+            table.append((offset, buffer.nbytes))
+            offset += buffer.nbytes
+        record_size = offset
+        parts = [struct.pack(RECORD_HEADER_FORMAT, record_size, index, time_ns, len(meta), len(buffers))]
+        parts.extend(struct.pack(BUFFER_FORMAT, *v) for v in table)
+        parts.append(meta)
+        end = RECORD_HEADER_SIZE + BUFFER_SIZE * len(buffers) + len(meta)
+        for (buffer_offset, nbytes), buffer in zip(table, buffers):
+            parts.append(b'\0' * (buffer_offset - end))
+            parts.append(buffer)
+            end = buffer_offset + nbytes
+        for part in parts:
+            self.f.write(part)
+        self.f.flush()
+        self.position += record_size
+        self.n_records += 1
+
+    def close(self):
+        self.f.close()
+
+
+class CaptureReader:
+    '''
+    memory-maps a capture file written by CaptureWriter, read returns (name, index, time_ns, value)
+    ndarrays of values are read-only views of the file
+    '''
+    def __init__(self, fp):
+        self.fp = fp
+        self.f = open(fp, 'rb')
+        size = os.fstat(self.f.fileno()).st_size
+        assert size >= FILE_HEADER_SIZE, f'{fp} is not a capture file'
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _ = struct.unpack_from(FILE_HEADER_FORMAT, self.mm, 0)
+        assert magic == CAPTURE_MAGIC, f'{fp} is not a capture file'
+        self.buf = memoryview(self.mm)
+        # offsets of complete records
+        self.offsets = []
+        position = FILE_HEADER_SIZE
+        while position + RECORD_HEADER_SIZE <= size:
+            record_size = struct.unpack_from('<Q', self.mm, position)[0]
+            if record_size == 0 or position + record_size > size:
+                break
+            self.offsets.append(position)
+            position += record_size
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_time_ns(self, i):
+        return struct.unpack_from(RECORD_HEADER_FORMAT, self.mm, self.offsets[i])[2]
+
+    def read(self, i):
+        position = self.offsets[i]
+        _, index, time_ns, meta_size, n_buffers = struct.unpack_from(RECORD_HEADER_FORMAT, self.mm, position)
+        buffers = []
+        for j in range(n_buffers):
+            offset, nbytes = struct.unpack_from(BUFFER_FORMAT, self.mm, position + RECORD_HEADER_SIZE + BUFFER_SIZE * j)
+            buffers.append(self.buf[position + offset:position + offset + nbytes])
+        meta_offset = position + RECORD_HEADER_SIZE + BUFFER_SIZE * n_buffers
+        name, value = pickle.loads(self.buf[meta_offset:meta_offset + meta_size], buffers=buffers)
+        return name, index, time_ns, value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.read(i)
@@ -0,0 +1,73 @@
+import multiprocessing
+
+from .subblocks import QueueMsg, CONTROL_WAKE
+
+
+class ControlChannel:
+    '''
+    inbox of control messages of a subblock and replicas of a processor shared between processes
+    the receiver polls it before every get of its input queue, so messages never wait behind queued data
+    a receiver blocked on its input queue is woken by a CONTROL_WAKE QueueMsg put into wake_queue,
+    receivers without wake_queue poll the channel every poll_s seconds while they wait
+    '''
+    def __init__(self, poll_s=0.005):
+        self.queue = multiprocessing.Queue()
+        self.lock = multiprocessing.Lock()
+        self.n_pending = multiprocessing.RawValue('q', 0)
+        # number of receivers blocked on the input queue
+        self.n_waiting = multiprocessing.RawValue('q', 0)
+        # input queue of the receiver, set by Pipeline
+        self.wake_queue = None
+        self.poll_s = poll_s
+
+    def put(self, msg):
+        self.queue.put(msg)
+        with self.lock:
+            self.n_pending.value += 1
+            wake = self.n_waiting.value > 0
+        if wake and self.wake_queue is not None:
+            self.wake_queue.put(QueueMsg(msg=CONTROL_WAKE))
+
+    def poll(self):
+        '''
+        returns all pending messages, every message is returned to only one receiver
+        '''
+        msgs = []
+        while self.n_pending.value > 0:
+            with self.lock:
+                if self.n_pending.value == 0:
+                    break
+                self.n_pending.value -= 1
+            msgs.append(self.queue.get())
+        return msgs
+
+    def start_wait(self):
+        '''
+        returns False if there are pending messages, else the receiver is counted as waiting until stop_wait
+        '''
+        with self.lock:
+            if self.n_pending.value > 0:
+                return False
+            self.n_waiting.value += 1
+            return True
+
+    def stop_wait(self):
+        with self.lock:
+            self.n_waiting.value -= 1
+
+
+class ControlRouter:
+    '''
+    replaces msg_queue and MsgProcessor, put delivers MetaMsg straight into the ControlChannel of the acceptor
+    routes {(acceptor_type, acceptor_name): ControlChannel} are computed once by Pipeline,
+    a None route is a pass-through subblock removed by Pipeline.compile, it ignored messages, so they are dropped
+    '''
+    def __init__(self, routes):
+        self.routes = routes
+
+    def put(self, msg, block=True, timeout=None):
+        key = (msg.acceptor_type, msg.acceptor_name)
+        if key not in self.routes:
+            raise Exception(f'no {msg.acceptor_type} of block {msg.acceptor_name} for msg of {msg.sender_subblock_name}')
+        if self.routes[key] is not None:
+            self.routes[key].put(msg.msg)
@@ -0,0 +1,43 @@
+import multiprocessing
+
+
+DEMAND_POLICIES = ('any', 'all')
+
+
+class Demand:
+    '''
+    demand credits of n_consumers consumers of a source block shared between processes
+    a consumer requests a QueueData when it is ready to take one, the source waits for requests before it produces
+    policy any - produce when some consumer requested, all - produce when every consumer requested
+    every produced QueueData takes the credits of all consumers
+    '''
+    def __init__(self, n_consumers, policy='any'):
+        assert n_consumers > 0
+        assert policy in DEMAND_POLICIES, policy
+        self.policy = policy
+        self.cond = multiprocessing.Condition()
+        self.credits = multiprocessing.RawArray('b', n_consumers)
+
+    def is_ready(self):
+        if self.policy == 'any':
+            return any(self.credits)
+        return all(self.credits)
+
+    def request(self, i):
+        if self.credits[i]:
+            return
+        with self.cond:
+            self.credits[i] = 1
+            if self.is_ready():
+                self.cond.notify_all()
+
+    def wait(self, timeout=None):
+        '''
+        returns False if there was no demand in timeout seconds
+        '''
+        with self.cond:
+            if not self.cond.wait_for(self.is_ready, timeout):
+                return False
+            for i in range(len(self.credits)):
+                self.credits[i] = 0
+            return True
@@ -0,0 +1,63 @@
+import multiprocessing
+import queue
+import threading
+import traceback
+
+
+def forward(src_queue, dst_queue):
+    while True:
+        dst_queue.put(src_queue.get())
+
+
+class FusedBlock(multiprocessing.Process):
+    '''
+    runs assembler, processor and dissembler of a block as threads of a single process
+    data is passed between them by reference through queue.Queue
+    queues created by Pipeline between them still receive QueueMsg, these are forwarded to the threads
+    '''
+    def __init__(self, name, assembler=None, processor=None, dissembler=None):
+        multiprocessing.Process.__init__(self)
+        assert processor is not None, name
+        self.block_name = name
+        self.assembler = assembler
+        self.processor = processor
+        self.dissembler = dissembler
+
+    def fuse(self):
+        forwarded = []
+        if self.assembler is not None:
+            assembler_queue = queue.Queue()
+            forwarded.append((self.assembler.input_queue, assembler_queue))
+            self.assembler.input_queue = assembler_queue
+            if self.processor.assembler_input_queue is not None:
+                self.processor.assembler_input_queue = assembler_queue
+
+            processor_queue = queue.Queue()
+            forwarded.append((self.processor.input_queue, processor_queue))
+            self.assembler.output_queue = processor_queue
+            self.processor.input_queue = processor_queue
+
+        if self.dissembler is not None:
+            dissembler_queue = queue.Queue()
+            forwarded.append((self.dissembler.input_queue, dissembler_queue))
+            self.processor.output_queue = dissembler_queue
+            self.dissembler.input_queue = dissembler_queue
+        return forwarded
+
+    def run(self):
+        try:
+            for src_queue, dst_queue in self.fuse():
+                threading.Thread(target=forward, args=(src_queue, dst_queue), daemon=True).start()
+            threads = []
+            for subblock in [self.assembler, self.processor, self.dissembler]:
+                if subblock is not None:
+                    thread = threading.Thread(target=subblock.run, name=subblock.subblock_name, daemon=True)
+                    thread.start()
+                    threads.append(thread)
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt as e:
+            print(f'{self.block_name}_FusedBlock KeyboardInterrupt')
+        except:
+            print(f'{self.block_name}_FusedBlock Exception')
+            print(traceback.format_exc())
@@ -0,0 +1,92 @@
+import heapq
+
+
+class IndexJoin:
+    '''
+    joins values of input_names by QueueData.index into dicts {input name: value}
+    add detects completion of an index in O(1), popped indexes move the watermark,
+    values of indexes not above the watermark are dropped, the pending indexes are evicted through a heap in index order
+    popped dicts are not referenced by the join anymore, so they are handed over without copying
+    at most max_pending incomplete indexes are kept if max_pending is not None, the oldest are evicted first
+    '''
+    def __init__(self, input_names, max_pending=None):
+        assert len(input_names) > 0
+        assert max_pending is None or max_pending > 0
+        self.input_names = frozenset(input_names)
+        self.n_inputs = len(self.input_names)
+        self.max_pending = max_pending
+        self.values = dict()
+        self.heap = []
+        # complete indexes that were not popped yet
+        self.complete = []
+        self.watermark = None
+        # indexes evicted before they were popped and values that came after their index was evicted
+        self.n_dropped = 0
+
+    def add(self, name, index, value):
+        '''
+        returns True if all values of the index are joined
+        '''
+        assert name in self.input_names, name
+        if self.watermark is not None and index <= self.watermark:
+            self.n_dropped += 1
+            return False
+        values = self.values.get(index)
+        if values is None:
+            values = dict()
+            self.values[index] = values
+            heapq.heappush(self.heap, index)
+        complete = len(values) == self.n_inputs
+        values[name] = value
+        if not complete and len(values) == self.n_inputs:
+            self.complete.append(index)
+            complete = True
+        if self.max_pending is not None and len(self.values) - len(self.complete) > self.max_pending:
+            self.evict_oldest_incomplete()
+        return complete
+
+    def evict_oldest_incomplete(self):
+        # its index stays in the heap until the watermark passes it
+        complete = set(self.complete)
+        del self.values[min(k for k in self.values if k not in complete)]
+        self.n_dropped += 1
+
+    def evict(self, watermark):
+        '''
+        drops all indexes up to watermark
+        '''
+        self.watermark = watermark if self.watermark is None else max(self.watermark, watermark)
+        while len(self.heap) > 0 and self.heap[0] <= self.watermark:
+            index = heapq.heappop(self.heap)
+            # popped and evicted indexes are already removed from values
+            if index in self.values:
+                del self.values[index]
+                self.n_dropped += 1
+        self.complete = [k for k in self.complete if k > self.watermark]
+
+    def n_complete(self):
+        return len(self.complete)
+
+    def pop_latest(self):
+        '''
+        returns (index, joined dict) of the latest complete index or None, older indexes are dropped
+        '''
+        if len(self.complete) == 0:
+            return None
+        index = max(self.complete)
+        values = self.values.pop(index)
+        self.complete.remove(index)
+        self.evict(index)
+        return index, values
+
+    def pop_complete(self):
+        '''
+        returns [(index, joined dict)] of all complete indexes in index order, incomplete older indexes are dropped
+        '''
+        if len(self.complete) == 0:
+            return []
+        indexes = sorted(self.complete)
+        result = [(index, self.values.pop(index)) for index in indexes]
+        self.complete = []
+        self.evict(indexes[-1])
+        return result
@@ -0,0 +1,42 @@
+import bisect
+import multiprocessing
+
+import numpy as np
+
+
+class LatencyHistogram:
+    '''
+    latency counts in n_bins log-spaced bins from min_s to max_s seconds shared between processes,
+    the first and the last bins also count latencies out of the range
+    '''
+    def __init__(self, n_bins=64, min_s=1e-4, max_s=100):
+        assert n_bins > 1 and 0 < min_s < max_s
+        self.edges = list(np.geomspace(min_s, max_s, n_bins + 1))
+        self.counts = multiprocessing.Array('q', n_bins)
+        self.total = multiprocessing.RawValue('d', 0)
+
+    def add(self, latency_s):
+        i = min(max(bisect.bisect_right(self.edges, latency_s) - 1, 0), len(self.counts) - 1)
+        with self.counts.get_lock():
+            self.counts[i] += 1
+            self.total.value += latency_s
+
+    def get(self):
+        '''
+        returns bin edges in seconds, counts and mean latency
+        '''
+        with self.counts.get_lock():
+            counts = np.array(self.counts[:], dtype=np.int64)
+            total = self.total.value
+        n = counts.sum()
+        return np.array(self.edges), counts, total / n if n > 0 else None
+
+    def percentile(self, q):
+        '''
+        upper edge of the bin of q percentile
+        '''
+        edges, counts, _ = self.get()
+        if counts.sum() == 0:
+            return None
+        i = np.searchsorted(np.cumsum(counts), q / 100 * counts.sum())
+        return float(edges[min(i, len(counts) - 1) + 1])
@@ -0,0 +1,240 @@
+import json
+import math
+from collections import defaultdict
+from os.path import join
+
+import numpy as np
+
+from .tracing import EVENT_CODES, KIND_DATA
+
+
+GRAPH_FN = 'graph.json'
+SUBBLOCK_TYPES = ['assembler', 'processor', 'dissembler']
+
+
+def load_graph(log_dirpath):
+    '''
+    {block_name: {'outputs': [...], 'replicas': n}} written by Pipeline.set_loggers
+    '''
+    with open(join(log_dirpath, GRAPH_FN), 'r') as f:
+        return json.load(f)
+
+
+def get_first_times(log, event):
+    '''
+    returns unique QueueData indexes and times in seconds of their first event
+    '''
+    mask = (log['event'] == EVENT_CODES[event]) & (log['kind'] == KIND_DATA)
+    indexes, first = np.unique(log['index'][mask], return_index=True)
+    return indexes, log['time'][mask][first] * 1e-9
+
+
+def get_subblock_stats(log):
+    '''
+    busy time is everything except waiting on the input queue, from queue_wait to input_queue.get,
+    service time is busy time per processed QueueData
+    '''
+    time = log['time'] * 1e-9
+    event = log['event']
+    is_data = log['kind'] == KIND_DATA
+    wait_positions = np.flatnonzero(event == EVENT_CODES['queue_wait'])
+    get_positions = np.flatnonzero(event == EVENT_CODES['input_queue.get'])
+    # every queue_wait is followed by its input_queue.get unless the subblock was stopped while waiting
+    n = min(len(wait_positions), len(get_positions))
+    idle = float(np.sum(time[get_positions[:n]] - time[wait_positions[:n]]))
+    span = float(time[-1] - time[0]) if len(time) > 1 else 0.0
+    busy = max(span - idle, 0.0)
+    n_items = int(np.sum(is_data & (event == EVENT_CODES['input_queue.get'])))
+    if len(get_positions) == 0:
+        # input blocks without input queue
+        n_items = int(np.sum(is_data & (event == EVENT_CODES['output_queue.put'])))
+    return {
+        'span': span,
+        'busy': busy,
+        'idle': idle,
+        'utilization': busy / span if span > 0 else 0.0,
+        'n_items': n_items,
+        'service_time': busy / n_items if n_items > 0 else None
+    }
+
+
+def get_queueing_delay(log, upstream_logs):
+    '''
+    mean time from put of QueueData by the upstream subblocks to its get, the latest upstream put is used
+    '''
+    indexes, get_times = get_first_times(log, 'input_queue.get')
+    put_times = np.full(len(indexes), -np.inf)
+    for upstream_log in upstream_logs:
+        upstream_indexes, upstream_times = get_first_times(upstream_log, 'output_queue.put')
+        _, i, j = np.intersect1d(indexes, upstream_indexes, assume_unique=True, return_indices=True)
+        put_times[i] = np.maximum(put_times[i], upstream_times[j])
+    mask = np.isfinite(put_times)
+    if not np.any(mask):
+        return None
+    return float(np.mean(np.maximum(get_times[mask] - put_times[mask], 0)))
+
+
+def get_paths(graph):
+    '''
+    all paths from input blocks to blocks without outputs, cycles are cut
+    '''
+    has_inputs = {k for v in graph.values() for k in v['outputs']}
+    paths = []
+
+    def walk(path):
+        outputs = [k for k in graph[path[-1]]['outputs'] if k not in path]
+        if len(outputs) == 0:
+            paths.append(path)
+        for k in outputs:
+            walk(path + [k])
+
+    for name in graph:
+        if name not in has_inputs:
+            walk([name])
+    return paths
+
+
+def get_report(log_dirpath, logs, target_fps=None):
+    '''
+    logs are view_log.load_logs results
+    returns per subblock stats, per block stats, critical path and replica suggestions for target_fps
+
+    a block runs its subblocks concurrently, so its fps is limited by the slowest subblock
+    and processor replicas divide the processor service time,
+    the critical path is the input to output path with the lowest fps, ties are broken by latency
+    '''
+    graph = load_graph(log_dirpath)
+    subblock_logs = defaultdict(dict)
+    replica_logs = defaultdict(list)
+    for (block_i, block_j, name, subblock_type), log in logs.items():
+        if len(log['time']) == 0:
+            continue
+        block_name = name.split('.')[0]
+        if subblock_type == 'processor':
+            replica_logs[block_name].append(log)
+        if name == block_name:
+            subblock_logs[block_name][subblock_type] = log
+
+    inputs = defaultdict(list)
+    for name, v in graph.items():
+        for k in v['outputs']:
+            inputs[k].append(name)
+
+    subblocks = dict()
+    blocks = dict()
+    for name in graph:
+        if name not in subblock_logs:
+            continue
+        types = [t for t in SUBBLOCK_TYPES if t in subblock_logs[name]]
+        block_latency = 0.0
+        block_service_time = 0.0
+        for subblock_type in types:
+            if subblock_type == 'processor':
+                replica_stats = [get_subblock_stats(log) for log in replica_logs[name]]
+                service_times = [v['service_time'] for v in replica_stats if v['service_time'] is not None]
+                stats = get_subblock_stats(subblock_logs[name][subblock_type])
+                stats['utilization'] = float(np.mean([v['utilization'] for v in replica_stats]))
+                stats['n_items'] = sum(v['n_items'] for v in replica_stats)
+                stats['service_time'] = float(np.mean(service_times)) if len(service_times) > 0 else None
+                stats['replicas'] = len(replica_stats)
+                logs_to_match = replica_logs[name]
+            else:
+                stats = get_subblock_stats(subblock_logs[name][subblock_type])
+                stats['replicas'] = 1
+                logs_to_match = [subblock_logs[name][subblock_type]]
+
+            j = types.index(subblock_type)
+            if j > 0:
+                upstream_logs = replica_logs[name] if types[j - 1] == 'processor' else [subblock_logs[name][types[j - 1]]]
+            else:
+                upstream_logs = []
+                for input_name in inputs[name]:
+                    if input_name in subblock_logs:
+                        last_type = [t for t in SUBBLOCK_TYPES if t in subblock_logs[input_name]][-1]
+                        if last_type == 'processor':
+                            upstream_logs.extend(replica_logs[input_name])
+                        else:
+                            upstream_logs.append(subblock_logs[input_name][last_type])
+            delays = [get_queueing_delay(log, upstream_logs) for log in logs_to_match]
+            delays = [v for v in delays if v is not None]
+            stats['queueing_delay'] = float(np.mean(delays)) if len(delays) > 0 else None
+
+            if stats['service_time'] is not None:
+                block_latency += stats['service_time'] + (stats['queueing_delay'] or 0.0)
+                block_service_time = max(block_service_time, stats['service_time'] / stats['replicas'])
+            subblocks[(name, subblock_type)] = stats
+        blocks[name] = {
+            'latency': block_latency,
+            'service_time': block_service_time,
+            'max_fps': 1 / block_service_time if block_service_time > 0 else math.inf
+        }
+
+    paths = []
+    for path in get_paths(graph):
+        path = [k for k in path if k in blocks]
+        if len(path) == 0:
+            continue
+        bottleneck = min(path, key=lambda k: blocks[k]['max_fps'])
+        paths.append({
+            'path': path,
+            'bottleneck': bottleneck,
+            'max_fps': blocks[bottleneck]['max_fps'],
+            'latency': sum(blocks[k]['latency'] for k in path)
+        })
+    critical_path = min(paths, key=lambda v: (v['max_fps'], -v['latency'])) if len(paths) > 0 else None
+
+    suggestions = dict()
+    if target_fps is not None:
+        for (name, subblock_type), stats in subblocks.items():
+            if stats['service_time'] is None:
+                continue
+            # only processors that have an input queue could be replicated
+            replicable = subblock_type == 'processor' and len(inputs[name]) > 0
+            needed = max(math.ceil(target_fps * stats['service_time']), 1)
+            if replicable or needed > 1:
+                suggestions[(name, subblock_type)] = {'replicas': needed, 'replicable': replicable}
+
+    return {
+        'subblocks': subblocks,
+        'blocks': blocks,
+        'paths': paths,
+        'critical_path': critical_path,
+        'suggestions': suggestions
+    }
+
+
+def print_report(report, target_fps=None):
+    from prettytable import PrettyTable
+
+    def ms(x):
+        return '-' if x is None else f'{x * 1000:.2f}'
+
+    pt = PrettyTable(['name', 'replicas', 'items', 'utilization %', 'service ms', 'queueing ms', 'suggested replicas'])
+    for (name, subblock_type), stats in report['subblocks'].items():
+        suggestion = report['suggestions'].get((name, subblock_type))
+        if suggestion is not None:
+            suggestion = str(suggestion['replicas']) if suggestion['replicable'] else f'{suggestion["replicas"]}, not replicable'
+        pt.add_row([
+            f'{name} {subblock_type}',
+            stats['replicas'],
+            stats['n_items'],
+            f'{stats["utilization"] * 100:.1f}',
+            ms(stats['service_time']),
+            ms(stats['queueing_delay']),
+            '-' if suggestion is None else suggestion
+        ])
+    print(pt)
+
+    pt = PrettyTable(['path', 'bottleneck', 'max fps', 'latency ms'])
+    for v in sorted(report['paths'], key=lambda v: (v['max_fps'], -v['latency'])):
+        pt.add_row([' -> '.join(v['path']), v['bottleneck'], f'{v["max_fps"]:.2f}', ms(v['latency'])])
+    print(pt)
+
+    critical_path = report['critical_path']
+    if critical_path is not None:
+        print(
+            f'critical path {" -> ".join(critical_path["path"])} is limited by {critical_path["bottleneck"]} '
+            f'to {critical_path["max_fps"]:.2f} fps'
+        )
+        if target_fps is not None and critical_path['max_fps'] < target_fps:
+            print(f'target {target_fps:.2f} fps is not reached, see suggested replicas')
@@ -0,0 +1,206 @@
+import http.server
+import multiprocessing
+import os
+import threading
+import time
+
+from .latency import LatencyHistogram
+
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class SubBlockMetrics:
+    '''
+    counters of a subblock in shared memory, updated by SubBlock.log from the subblock process
+    processing time is time from input_queue.get of QueueData to the end of its processing
+    '''
+    def __init__(self):
+        self.processed = multiprocessing.RawValue('q', 0)
+        self.outputs = multiprocessing.RawValue('q', 0)
+        self.dropped = multiprocessing.RawValue('q', 0)
+        self.processing_time = LatencyHistogram(n_bins=32, min_s=1e-5, max_s=10)
+        self.start_time = None
+
+    def record(self, msg, data):
+        if msg == 'input_queue.get':
+            if data is not None and hasattr(data, 'index'):
+                self.processed.value += 1
+                self.start_time = time.perf_counter()
+        elif msg == 'output_queue.put':
+            if data is not None and hasattr(data, 'index'):
+                self.outputs.value += 1
+        elif msg in ['tmp', 'queue_wait'] and self.start_time is not None:
+            self.processing_time.add(time.perf_counter() - self.start_time)
+            self.start_time = None
+
+    def count_dropped(self, n=1):
+        self.dropped.value += n
+
+
+def get_process_stats(pid):
+    '''
+    returns cpu seconds and rss bytes of a process from /proc, None if the process is gone
+    '''
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # the command name is in parentheses and could contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError):
+        return None
+    # utime and stime are fields 14 and 15 of stat, fields[0] is field 3
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK, rss_pages * PAGE_SIZE
+
+
+def format_labels(labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def format_histogram(lines, name, labels, histogram):
+    edges, counts, mean = histogram.get()
+    labels_s = format_labels(labels)
+    total = 0
+    for edge, count in zip(edges[1:], counts):
+        total += int(count)
+        lines.append(f'{name}_bucket{{{labels_s},le="{edge:.6g}"}} {total}')
+    lines.append(f'{name}_bucket{{{labels_s},le="+Inf"}} {total}')
+    lines.append(f'{name}_sum{{{labels_s}}} {0 if mean is None else mean * total}')
+    lines.append(f'{name}_count{{{labels_s}}} {total}')
+
+
+def get_metrics_text(pipeline):
+    '''
+    metrics of a running pipeline in Prometheus text format
+    '''
+    metric_types = {
+        'mpp_processed_total': 'counter',
+        'mpp_outputs_total': 'counter',
+        'mpp_dropped_total': 'counter',
+        'mpp_expired_total': 'counter',
+        'mpp_cache_hits_total': 'counter',
+        'mpp_cache_misses_total': 'counter',
+        'mpp_processing_seconds': 'histogram',
+        'mpp_queue_depth': 'gauge',
+        'mpp_queue_dropped_total': 'counter',
+        'mpp_cpu_seconds_total': 'counter',
+        'mpp_rss_bytes': 'gauge',
+        'mpp_latency_seconds': 'histogram'
+    }
+    metric_lines = {k: [] for k in metric_types}
+
+    pids = dict()
+    for subblock_type, subblocks in [
+        ('assembler', pipeline.assemblers),
+        ('processor', pipeline.processors),
+        ('dissembler', pipeline.dissemblers),
+        ('reorderer', pipeline.reorderers)
+    ]:
+        for name, subblock in subblocks.items():
+            named_subblocks = [(0, subblock)]
+            if subblock_type == 'processor':
+                named_subblocks.extend((r + 1, v) for r, v in enumerate(pipeline.processor_replicas.get(name, [])))
+            for replica, v in named_subblocks:
+                labels = {'block': name, 'subblock': subblock_type, 'replica': replica}
+                if name in pipeline.fused_blocks:
+                    pid = pipeline.fused_blocks[name].pid
+                elif v.backend == 'process':
+                    pid = v.pid
+                else:
+                    pid = os.getpid()
+                if pid is not None:
+                    pids[pid] = labels
+                labels_s = format_labels(labels)
+                if v.n_expired is not None:
+                    metric_lines['mpp_expired_total'].append(f'mpp_expired_total{{{labels_s}}} {v.n_expired.value}')
+                if getattr(v, 'cache', None) is not None:
+                    metric_lines['mpp_cache_hits_total'].append(f'mpp_cache_hits_total{{{labels_s}}} {v.cache.hits.value}')
+                    metric_lines['mpp_cache_misses_total'].append(f'mpp_cache_misses_total{{{labels_s}}} {v.cache.misses.value}')
+                if v.metrics is None:
+                    continue
+                metric_lines['mpp_processed_total'].append(f'mpp_processed_total{{{labels_s}}} {v.metrics.processed.value}')
+                metric_lines['mpp_outputs_total'].append(f'mpp_outputs_total{{{labels_s}}} {v.metrics.outputs.value}')
+                metric_lines['mpp_dropped_total'].append(f'mpp_dropped_total{{{labels_s}}} {v.metrics.dropped.value}')
+                format_histogram(metric_lines['mpp_processing_seconds'], 'mpp_processing_seconds', labels, v.metrics.processing_time)
+
+    for queue_type, queues in [
+        ('assembler', pipeline.assembler_queues),
+        ('processor', pipeline.processor_queues),
+        ('dissembler', pipeline.dissembler_queues)
+    ]:
+        for name, q in queues.items():
+            if q is None:
+                continue
+            try:
+                depth = q.qsize()
+            except NotImplementedError:
+                continue
+            labels_s = format_labels({'block': name, 'queue': queue_type})
+            metric_lines['mpp_queue_depth'].append(f'mpp_queue_depth{{{labels_s}}} {depth}')
+            if hasattr(q, 'n_dropped') and not isinstance(q.n_dropped, dict):
+                # Mailbox
+                metric_lines['mpp_queue_dropped_total'].append(
+                    f'mpp_queue_dropped_total{{{labels_s},producer="any"}} {q.n_dropped.value}'
+                )
+    for (producer, name), n in pipeline.get_dropped().items():
+        labels_s = format_labels({'block': name, 'queue': 'assembler', 'producer': producer})
+        metric_lines['mpp_queue_dropped_total'].append(f'mpp_queue_dropped_total{{{labels_s}}} {n}')
+
+    # subblocks with thread backend share the pipeline process
+    if os.getpid() in pids:
+        pids[os.getpid()] = {'block': 'pipeline', 'subblock': 'pipeline', 'replica': 0}
+    for pid, labels in pids.items():
+        stats = get_process_stats(pid)
+        if stats is None:
+            continue
+        labels_s = format_labels(dict(labels, pid=pid))
+        metric_lines['mpp_cpu_seconds_total'].append(f'mpp_cpu_seconds_total{{{labels_s}}} {stats[0]}')
+        metric_lines['mpp_rss_bytes'].append(f'mpp_rss_bytes{{{labels_s}}} {stats[1]}')
+
+    if pipeline.provenance:
+        for path, histogram in pipeline.get_latency_histograms().items():
+            format_histogram(metric_lines['mpp_latency_seconds'], 'mpp_latency_seconds', {'path': '>'.join(path)}, histogram)
+
+    lines = []
+    for k, metric_type in metric_types.items():
+        if len(metric_lines[k]) > 0:
+            lines.append(f'# TYPE {k} {metric_type}')
+            lines.extend(metric_lines[k])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    '''
+    serves get_metrics_text of the pipeline at http://host:port/metrics from a daemon thread
+    '''
+    def __init__(self, pipeline, port, host='127.0.0.1'):
+        self.pipeline = pipeline
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ['/', '/metrics']:
+                    handler.send_error(404)
+                    return
+                body = get_metrics_text(self.pipeline).encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MetricsServer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,64 @@
+import hashlib
+import pickle
+
+import numpy as np
+
+
+def freeze(x):
+    '''
+    makes ndarrays of a QueueData value read-only in place, walks dicts, lists and tuples, returns x
+    subblocks hand values along without copying, a frozen value fails on write instead of changing data of other subblocks
+    '''
+    if isinstance(x, np.ndarray):
+        x.flags.writeable = False
+    elif isinstance(x, dict):
+        for v in x.values():
+            freeze(v)
+    elif isinstance(x, (list, tuple)):
+        for v in x:
+            freeze(v)
+    return x
+
+
+def thaw(x):
+    '''
+    writable copy of a value received from another subblock, ndarrays are copied, containers are rebuilt
+    '''
+    if isinstance(x, np.ndarray):
+        return x.copy()
+    elif isinstance(x, dict):
+        return {k: thaw(v) for k, v in x.items()}
+    elif isinstance(x, list):
+        return [thaw(v) for v in x]
+    elif isinstance(x, tuple):
+        return tuple(thaw(v) for v in x)
+    return x
+
+
+def update_fingerprint(h, x):
+    if isinstance(x, np.ndarray):
+        h.update(f'ndarray{x.shape}{x.dtype.str}'.encode())
+        if x.dtype.hasobject:
+            h.update(pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL))
+        else:
+            h.update(np.ascontiguousarray(x).data)
+    elif isinstance(x, dict):
+        h.update(f'dict{len(x)}'.encode())
+        for k, v in x.items():
+            update_fingerprint(h, k)
+            update_fingerprint(h, v)
+    elif isinstance(x, (list, tuple)):
+        h.update(f'{type(x).__name__}{len(x)}'.encode())
+        for v in x:
+            update_fingerprint(h, v)
+    else:
+        h.update(pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fingerprint(x):
+    '''
+    hash of the content of a value, is used to detect in-place modifications of shared values in debug mode
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    update_fingerprint(h, x)
+    return h.digest()
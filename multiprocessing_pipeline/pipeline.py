@@ -1,9 +1,31 @@
+import asyncio
+import json
 import multiprocessing
+import multiprocessing.queues
+import queue
+import threading
 import traceback
 import os
 import os.path as osp
 
-from .subblocks import QueueMsg, Assembler, Processor, Dissembler
+from .subblocks import QueueData, QueueMsg, Assembler, Processor, BatchProcessor, Dissembler, Reorderer
+from .subblocks import SkipAssembler, NoSkipAssembler, WindowAssembler, DummyMultipleSkipAssembler, DummyProcessor, DummyDissembler
+from .subblocks import RESULT_DROPPED
+from .shm import SharedMemoryPool, SharedMemoryQueue
+from .queues import POLICIES, BoundedQueue, Mailbox, RingQueue, RelabelQueue
+from .fused import FusedBlock
+from .log_report import GRAPH_FN, get_paths
+from .latency import LatencyHistogram
+from .demand import DEMAND_POLICIES, Demand
+from .metrics import SubBlockMetrics, MetricsServer, get_metrics_text
+from .control import ControlChannel, ControlRouter
+from .batch import ResultIterator
+from .cache import ValueCache
+
+
+# process - own process, thread - thread of the pipeline process, 
+# asyncio - thread of the pipeline process with coroutine hooks run on a shared event loop
+BACKENDS = ('process', 'thread', 'asyncio')
 
 
 class MetaMsg:
@@ -30,12 +52,16 @@ class MsgProcessor(multiprocessing.Process):
             'processor': processor_queues,
             'dissembler': dissembler_queues
         }
+        # (acceptor_name, acceptor_type) of subblocks removed by Pipeline.compile, they ignored messages
+        self.eliminated = set()
 
     def run(self):
         try:
             while True:
                 msg = self.msg_queue.get()
                 assert isinstance(msg, MetaMsg), str(msg)
+                if (msg.acceptor_name, msg.acceptor_type) in self.eliminated:
+                    continue
                 self.queues[msg.acceptor_type][msg.acceptor_name].put(QueueMsg(msg=msg.msg))
         except Exception as e:
             print(f'MsgProcessor Exception')
@@ -47,20 +73,85 @@ class MsgProcessor(multiprocessing.Process):
 class Block:
     '''
     every block cound contain assembler, processor and dissembler subblocks
+    mailbox=True makes input queue of the processor a Mailbox of mailbox_size bytes: 
+    only the latest QueueData waits for the processor and no PROCESSOR_FED handshake is used
+    fused=True runs all subblocks of the block as threads of one process, see FusedBlock
     '''
-    def __init__(self, name, use_assembler=True, use_dissembler=True, skip_assembler=False):
+    def __init__(
+        self, name, 
+        use_assembler=True, use_dissembler=True, skip_assembler=False, 
+        mailbox=False, mailbox_size=1 << 24,
+        fused=False
+    ):
+        assert not (fused and mailbox), f'fused block {name} cannot use mailbox'
         self.name = name
         self.use_assembler = use_assembler
         self.use_dissembler = use_dissembler
         self.skip_assembler = skip_assembler
+        self.mailbox = mailbox
+        self.mailbox_size = mailbox_size
+        self.fused = fused
 
 
 class Pipeline:
-    def __init__(self, check_cycles=True):
+    def __init__(
+        self, 
+        check_cycles=True, 
+        shm_slots=0, shm_slot_size=1 << 24, 
+        ring_queues=False, ring_size=1 << 22, ring_spin=0,
+        provenance=False, metrics_port=None, debug_payloads=False,
+        control_plane=False, optimize=False
+    ):
+        '''
+        shm_slots > 0 enables zero-copy transport of ndarrays of QueueData values 
+        through a pool of shm_slots shared memory slots of shm_slot_size bytes
+        ring_queues=True makes queues with a single data producer and consumer RingQueue of ring_size bytes,
+        these are assembler to processor and processor to dissembler queues
+        provenance=True adds lineages of block timestamps to QueueData, 
+        blocks without outputs count end-to-end latency of every path to them, see get_latency_histograms
+        metrics_port is not None makes subblocks count metrics in shared memory that are served 
+        in Prometheus text format at http://127.0.0.1:metrics_port/metrics, 0 picks a free port, see MetricsServer
+        QueueData values are handed along without copying, debug_payloads=True makes output values read-only
+        and raises if a subblock modifies its input or an output it handed off, see payload
+        control_plane=True delivers MetaMsg straight to a ControlChannel of the acceptor that is handled before its queued data,
+        MsgProcessor is not started, see set_control_plane
+        optimize=True removes pass-through subblocks on start, see compile
+        '''
         self.check_cycles = check_cycles
+        self.shm_pool = SharedMemoryPool(shm_slots, shm_slot_size) if shm_slots > 0 else None
+        self.ring_queues = ring_queues
+        self.ring_size = ring_size
+        self.ring_spin = ring_spin
+        self.provenance = provenance
+        # path of block names -> LatencyHistogram
+        self.latency_histograms = dict()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.debug_payloads = debug_payloads
+        self.control_plane = control_plane
+        self.control_router = None
+        self.optimize = optimize
+        # execution plan of compile
+        self.plan = None
+        # block fed with values from the pipeline process and blocks that return results, see set_input and set_result
+        self.input_name = None
+        self.max_in_flight = None
+        self.result_names = []
+        self.result_queue = None
+        self.next_index = 0
+        # index -> {result block name: value} of submitted values that do not have all results yet
+        self.in_flight = dict()
+        # index -> result of submitted values that were not returned yet
+        self.completed = dict()
+        # block name -> latency budget in ms
+        self.latency_budgets = dict()
+        # source block name -> demand policy
+        self.pulls = dict()
 
         self.blocks = dict()
         self.outputs = dict()
+        # (name, output_name) -> (capacity, policy)
+        self.output_limits = dict()
 
         self.assembler_queues = dict()
         self.processor_queues = dict()
@@ -69,6 +160,12 @@ class Pipeline:
         self.assemblers = dict()
         self.processors = dict()
         self.dissemblers = dict()
+        # additional replicas of processors that share the input queue of self.processors[name]
+        self.processor_replicas = dict()
+        self.reorderers = dict()
+        self.fused_blocks = dict()
+        self.threads = []
+        self.loop = None
 
         # is the only queue to transmit MetaMsg messages
         # is not suited for QueueEl, QueueMsg or QueueData messages that are used to communicate beetween subblocks
@@ -77,9 +174,17 @@ class Pipeline:
     def add_block(self, block):
         self.blocks[block.name] = block
 
-    def set_outputs(self, name, output_names):
+    def set_outputs(self, name, output_names, capacity=None, policy='block'):
+        '''
+        capacity limits number of QueueData of block name waiting in the input queue of every output block,
+        policy defines what happens when block name puts into a full queue, see BoundedQueue
+        '''
         assert name in self.blocks, name
+        assert policy in POLICIES, policy
         self.outputs[name] = output_names
+        if capacity is not None:
+            for k in output_names:
+                self.output_limits[(name, k)] = (capacity, policy)
 
     def _check_connections(self, name):
         assert self.visited[name] != 1, 'cycle in connections'
@@ -102,17 +207,61 @@ class Pipeline:
                 if self.visited[k] == 0:
                     self._check_connections(k)
 
+    def create_queue(self):
+        if self.shm_pool is not None:
+            return SharedMemoryQueue(self.shm_pool)
+        else:
+            return multiprocessing.Queue()
+
+    def create_spsc_queue(self):
+        if self.ring_queues:
+            return RingQueue(self.ring_size, spin=self.ring_spin, pool=self.shm_pool)
+        else:
+            return self.create_queue()
+
+    def create_input_queue(self, name):
+        limits = {k: v for (k, output_name), v in self.output_limits.items() if output_name == name}
+        if len(limits) == 0:
+            return self.create_queue()
+        return BoundedQueue(limits, pool=self.shm_pool)
+
     def create_queues(self):
         for k, v in self.blocks.items():
-            self.assembler_queues[k] = multiprocessing.Queue() if v.use_assembler else None
-            self.processor_queues[k] = multiprocessing.Queue()
-            self.dissembler_queues[k] = multiprocessing.Queue() if v.use_dissembler and len(self.outputs[k]) > 0 else None
+            if v.mailbox and v.skip_assembler:
+                assert all(output_name != k for _, output_name in self.output_limits), f'mailbox of block {k} cannot be bounded'
+            if v.fused:
+                # FusedBlock forwards inputs into local queues without limits
+                assert all(output_name != k for _, output_name in self.output_limits), f'input of fused block {k} cannot be bounded'
+            if v.use_assembler and not v.skip_assembler:
+                self.assembler_queues[k] = self.create_input_queue(k)
+            else:
+                self.assembler_queues[k] = self.create_queue() if v.use_assembler else None
+            if v.mailbox:
+                self.processor_queues[k] = Mailbox(v.mailbox_size, pool=self.shm_pool)
+            elif v.skip_assembler:
+                self.processor_queues[k] = self.create_input_queue(k)
+            elif v.use_assembler:
+                self.processor_queues[k] = self.create_spsc_queue()
+            else:
+                self.processor_queues[k] = self.create_queue()
+            self.dissembler_queues[k] = self.create_spsc_queue() if v.use_dissembler and len(self.outputs[k]) > 0 else None
         self.msg_processor = MsgProcessor(self.msg_queue, self.assembler_queues, self.processor_queues, self.dissembler_queues)
 
-    def set_assembler(self, name, process_class, **kwargs):
+    def get_input_queue(self, name):
+        if self.blocks[name].skip_assembler:
+            return self.processor_queues[name]
+        else:
+            return self.assembler_queues[name]
+
+    def check_backend(self, name, backend):
+        assert backend in BACKENDS, backend
+        assert backend == 'process' or not self.blocks[name].fused, f'fused block {name} can only use process backend'
+
+    def set_assembler(self, name, process_class, backend='process', **kwargs):
         assert issubclass(process_class, Assembler), name
         assert self.blocks[name].use_assembler, name
         assert not self.blocks[name].skip_assembler
+        self.check_backend(name, backend)
         class_member = process_class(
             name, 
             self.msg_queue,
@@ -120,52 +269,287 @@ class Pipeline:
             self.processor_queues[name], 
             **kwargs
         )
+        class_member.use_handshake = not self.blocks[name].mailbox
+        class_member.bounded_input = isinstance(self.assembler_queues[name], BoundedQueue)
+        class_member.backend = backend
         self.assemblers[name] = class_member
 
-    def set_processor(self, name, process_class, **kwargs):
+    def set_processor(self, name, process_class, replicas=1, max_pending=16, backend='process', **kwargs):
+        '''
+        replicas > 1 starts several processes that share the input queue of the block,
+        their outputs are merged back into input order with at most max_pending outputs buffered
+        '''
+        assert replicas >= 1, name
+        self.check_backend(name, backend)
+        assert replicas == 1 or not self.blocks[name].fused, f'processor of fused block {name} cannot be replicated'
         if self.blocks[name].use_dissembler:
             output_queue = self.dissembler_queues[name]
         elif name not in self.outputs or len(self.outputs[name]) == 0:
             output_queue = None
         elif len(self.outputs[name]) == 1:
-            child_name = self.outputs[name][0]
-            if self.blocks[child_name].skip_assembler:
-                output_queue = self.processor_queues[child_name]
-            else:
-                output_queue = self.assembler_queues[child_name]
+            output_queue = self.get_input_queue(self.outputs[name][0])
         else:
-            raise Exception(f'cannot set processor output queue for block {name}')
+            # processor routes its outputs itself, see Processor.route
+            output_queue = [self.get_input_queue(k) for k in self.outputs[name]]
 
         if self.blocks[name].use_assembler or self.blocks[name].skip_assembler:
             input_queue = self.processor_queues[name]
         else:
             input_queue = None
 
-        class_member = process_class(
-            name,
-            self.msg_queue,
-            input_queue=input_queue,
-            output_queue=output_queue,
-            assembler_input_queue=self.assembler_queues[name] if self.blocks[name].use_assembler else None,
-            **kwargs
-        )
-        self.processors[name] = class_member
+        block = self.blocks[name]
+        if block.use_assembler and not block.skip_assembler and not block.mailbox:
+            assembler_input_queue = self.assembler_queues[name]
+        else:
+            assembler_input_queue = None
 
-    def set_dissembler(self, name, process_class, **kwargs):
+        if replicas > 1:
+            assert input_queue is not None, f'source processor of block {name} cannot be replicated'
+            assert not isinstance(output_queue, list) or process_class.route is Processor.route, \
+                f'outputs of replicated processor of block {name} cannot be routed'
+            seq_counter = multiprocessing.Value('q', 0)
+            if isinstance(input_queue, RingQueue):
+                # replicas are several consumers
+                input_queue.unlink()
+                input_queue = self.create_queue()
+                self.processor_queues[name] = input_queue
+                if name in self.assemblers:
+                    self.assemblers[name].output_queue = input_queue
+            if output_queue is not None:
+                reorderer_queue = self.create_queue()
+                self.reorderers[name] = Reorderer(
+                    name, 
+                    self.msg_queue, 
+                    reorderer_queue, 
+                    output_queue, 
+                    max_pending=max_pending
+                )
+                self.reorderers[name].backend = backend
+                output_queue = reorderer_queue
+
+        class_members = []
+        for _ in range(replicas):
+            class_member = process_class(
+                name,
+                self.msg_queue,
+                input_queue=input_queue,
+                output_queue=output_queue,
+                assembler_input_queue=assembler_input_queue,
+                **kwargs
+            )
+            class_member.backend = backend
+            if replicas > 1:
+                class_member.seq_counter = seq_counter
+            if isinstance(output_queue, list):
+                class_member.outputs = self.outputs[name]
+            class_members.append(class_member)
+        self.processors[name] = class_members[0]
+        self.processor_replicas[name] = class_members[1:]
+
+    def set_capture(self, name, capture_fp):
+        '''
+        QueueData put by the processor of block name are appended to capture_fp, see CaptureWriter and ReplayProcessor
+        '''
+        assert name in self.processors, f'set processor of block {name} before set_capture'
+        assert len(self.processor_replicas[name]) == 0, f'replicated processor of block {name} cannot be captured'
+        assert self.processors[name].output_queue is not None, f'processor of block {name} has no outputs to capture'
+        self.processors[name].capture_fp = capture_fp
+
+    def set_cache(self, name, max_items=256, max_bytes=None, dirpath=None):
+        '''
+        processor of block name returns cached results for input values with the same content instead of calling process_value,
+        every replica has its own cache, process_value should not depend on anything but its input, see ValueCache
+        '''
+        assert name in self.processors, f'set processor of block {name} before set_cache'
+        processors = [self.processors[name]] + self.processor_replicas[name]
+        assert processors[0].input_queue is not None, f'processor of source block {name} cannot be cached'
+        assert not isinstance(processors[0], BatchProcessor), f'batch processor of block {name} cannot be cached'
+        for processor in processors:
+            processor.cache = ValueCache(max_items=max_items, max_bytes=max_bytes, dirpath=dirpath)
+
+    def get_cache_stats(self):
+        '''
+        {name: (hits, misses)} of cached processors
+        '''
+        result = dict()
+        for name, processor in self.processors.items():
+            if processor.cache is not None:
+                processors = [processor] + self.processor_replicas[name]
+                result[name] = (sum(v.cache.hits.value for v in processors), sum(v.cache.misses.value for v in processors))
+        return result
+
+    def set_dissembler(self, name, process_class, backend='process', **kwargs):
         assert issubclass(process_class, Dissembler), name
         assert self.blocks[name].use_dissembler, name
         assert len(self.outputs[name]) > 0, name
+        self.check_backend(name, backend)
         class_member = process_class(
             name, 
             self.msg_queue,
             self.dissembler_queues[name],
-            [self.assembler_queues[k] for k in self.outputs[name]],
+            [self.get_input_queue(k) for k in self.outputs[name]],
             **kwargs
         )
         class_member.outputs = self.outputs[name]
+        class_member.backend = backend
         self.dissemblers[name] = class_member
     
-    def set_loggers(self, log_dirpath):
+    def set_input(self, name, max_in_flight=64, backend='process'):
+        '''
+        source block name gets values from the pipeline process by submit and map instead of a source processor,
+        at most max_in_flight submitted values wait for their results, see set_result
+        '''
+        assert name in self.blocks, name
+        assert not self.blocks[name].use_assembler and not self.blocks[name].skip_assembler, f'block {name} is not a source'
+        assert len(self.outputs.get(name, [])) > 0, f'input block {name} has no outputs'
+        assert max_in_flight > 0, name
+        self.set_processor(name, DummyProcessor, backend=backend)
+        self.processors[name].input_queue = self.processor_queues[name]
+        self.input_name = name
+        self.max_in_flight = max_in_flight
+
+    def set_result(self, name):
+        '''
+        outputs of the processor of block name without outputs are returned to the pipeline process by results and map,
+        outputs of several blocks are joined into {name: value}, see check_result_paths for blocks in between
+        '''
+        assert name in self.processors, f'set processor of block {name} before set_result'
+        assert len(self.outputs.get(name, [])) == 0, f'result block {name} has outputs'
+        if self.result_queue is None:
+            self.result_queue = self.create_queue()
+        for processor in [self.processors[name]] + self.processor_replicas.get(name, []):
+            processor.output_queue = self.result_queue
+            # results are ordered by index in the pipeline process, replicas put QueueData instead of QueueSeq
+            processor.seq_counter = None
+        self.result_names.append(name)
+
+    def get_result_path_names(self):
+        '''
+        names of blocks on paths from the input block to result blocks
+        '''
+        def get_reachable(names, get_next):
+            reachable = set(names)
+            stack = list(names)
+            while len(stack) > 0:
+                for k in get_next(stack.pop()):
+                    if k not in reachable:
+                        reachable.add(k)
+                        stack.append(k)
+            return reachable
+
+        inputs = {k: [name for name, v in self.outputs.items() if k in v] for k in self.blocks}
+        downstream = get_reachable([self.input_name], lambda k: self.outputs.get(k, []))
+        upstream = get_reachable(self.result_names, lambda k: inputs[k])
+        return downstream & upstream
+
+    def check_result_paths(self):
+        '''
+        every submitted value waits for its result, so blocks between the input block and result blocks should not drop values:
+        skipping and window assemblers, mailboxes, latency budgets of assemblers and bounded outputs that drop are rejected,
+        processors that return None and reorderers that drop a late output of a replica report the index
+        to the pipeline process, then the value gives no result
+        '''
+        names = self.get_result_path_names()
+        for name in names:
+            assembler = self.assemblers.get(name)
+            if self.blocks[name].mailbox:
+                raise Exception(f'block {name} between input and result blocks has a mailbox that drops values')
+            if isinstance(assembler, (SkipAssembler, WindowAssembler, DummyMultipleSkipAssembler)):
+                raise Exception(f'block {name} between input and result blocks has {type(assembler).__name__} that drops values')
+            if assembler is not None and name in self.latency_budgets:
+                raise Exception(f'block {name} between input and result blocks has an assembler with latency budget')
+            for (k, output_name), (_, policy) in self.output_limits.items():
+                if k in names and output_name == name and policy != 'block':
+                    raise Exception(f'output {k} -> {name} between input and result blocks drops values by policy {policy}')
+            if name in self.processors:
+                for processor in [self.processors[name]] + self.processor_replicas.get(name, []):
+                    processor.drop_queue = self.result_queue
+            if name in self.reorderers:
+                self.reorderers[name].drop_queue = self.result_queue
+
+    def n_in_flight(self):
+        return len(self.in_flight)
+
+    def submit(self, value, timeout=None):
+        '''
+        puts value into the input block and returns its index, receives results while max_in_flight values are in flight
+        '''
+        assert self.input_name is not None, 'pipeline has no input block, see set_input'
+        assert len(self.result_names) > 0, 'pipeline has no result blocks, see set_result'
+        while self.n_in_flight() >= self.max_in_flight:
+            self.receive_result(timeout)
+        index = self.next_index
+        self.next_index += 1
+        self.in_flight[index] = dict()
+        # queues could be replaced by localize_queues
+        self.processors[self.input_name].input_queue.put(QueueData(name=self.input_name, index=index, value=value))
+        return index
+
+    def receive_result(self, timeout=None):
+        queue_el = self.processors[self.result_names[0]].output_queue.get(timeout=timeout)
+        if isinstance(queue_el, QueueMsg):
+            msg, index = queue_el.msg
+            assert msg == RESULT_DROPPED, msg
+            # a processor dropped the value, it gives no result
+            self.in_flight.pop(index, None)
+            return
+        values = self.in_flight.get(queue_el.index)
+        if values is None:
+            return
+        values[queue_el.name] = queue_el.value
+        if len(values) == len(self.result_names):
+            del self.in_flight[queue_el.index]
+            self.completed[queue_el.index] = values if len(self.result_names) > 1 else queue_el.value
+
+    def pop_result(self, ordered=True, timeout=None):
+        '''
+        returns (index, result) of a submitted value, the one with the lowest index if ordered, else any completed,
+        waits for it, returns None if no submitted value is left, raises queue.Empty if nothing came in timeout seconds
+        '''
+        while True:
+            if ordered:
+                if len(self.in_flight) + len(self.completed) == 0:
+                    return None
+                index = min(list(self.in_flight) + list(self.completed))
+                if index in self.completed:
+                    return index, self.completed.pop(index)
+            elif len(self.completed) > 0:
+                index = next(iter(self.completed))
+                return index, self.completed.pop(index)
+            elif len(self.in_flight) == 0:
+                return None
+            self.receive_result(timeout)
+
+    def results(self, ordered=True, timeout=None):
+        '''
+        iterator of (index, result) of all submitted values, supports for and async for, see ResultIterator
+        '''
+        return ResultIterator(self, ordered=ordered, with_index=True, timeout=timeout)
+
+    def map(self, values, ordered=True, timeout=None):
+        '''
+        submits values keeping max_in_flight of them in flight and iterates over their results,
+        results of values submitted before are returned too, supports for and async for, see ResultIterator
+        '''
+        return ResultIterator(self, values=values, ordered=ordered, with_index=False, timeout=timeout)
+
+    def get_dropped(self):
+        '''
+        number of QueueData dropped by the policy of every bounded output
+        '''
+        result = dict()
+        for k, v in list(self.assembler_queues.items()) + list(self.processor_queues.items()):
+            if isinstance(v, BoundedQueue):
+                for name, n in v.dropped().items():
+                    if (name, k) in self.output_limits:
+                        result[(name, k)] = n
+        return result
+
+    def set_loggers(self, log_dirpath, log_format='text', trace_capacity=1 << 20):
+        '''
+        log_format text writes .log files, binary writes .trace ring buffers of trace_capacity records, see Tracer
+        '''
+        assert log_format in ['text', 'binary'], log_format
         if log_dirpath is not None:
             os.makedirs(log_dirpath, exist_ok=True)
             mapping = [
@@ -176,16 +560,404 @@ class Pipeline:
             for i, block_name in enumerate(self.blocks):
                 for j, (subblock_type, subblocks) in enumerate(mapping):
                     if block_name in subblocks:
-                        subblocks[block_name].set_logger_fp(
-                            osp.join(
-                                log_dirpath, 
-                                f'{i:02d}_{j:02d} {block_name} {subblock_type}.log'
-                            )
-                        )
-
-    def start(self, log_dirpath=None):
-        self.set_loggers(log_dirpath)
-        for d in [self.assemblers, self.processors, self.dissemblers]:
-            for v in d.values():
-                v.start()
-        self.msg_processor.start()
+                        named_subblocks = [(block_name, subblocks[block_name])]
+                        if subblock_type == 'processor':
+                            for r, replica in enumerate(self.processor_replicas[block_name]):
+                                named_subblocks.append((f'{block_name}.{r + 1}', replica))
+                        for name, subblock in named_subblocks:
+                            fp = osp.join(log_dirpath, f'{i:02d}_{j:02d} {name} {subblock_type}')
+                            if log_format == 'text':
+                                subblock.set_logger_fp(f'{fp}.log')
+                            else:
+                                subblock.set_tracer_fp(f'{fp}.trace', capacity=trace_capacity)
+            # block graph for view_log --report
+            with open(osp.join(log_dirpath, GRAPH_FN), 'w') as f:
+                json.dump(self.get_graph(), f, indent=2)
+
+    def get_graph(self):
+        return {
+            name: {'outputs': self.outputs.get(name, []), 'replicas': 1 + len(self.processor_replicas.get(name, []))}
+            for name in self.blocks
+        }
+
+    def set_provenance(self):
+        '''
+        makes subblocks track QueueData.provenance, 
+        processors of blocks without outputs get a histogram for every path to them
+        '''
+        block_ids = {name: i for i, name in enumerate(self.blocks)}
+        for subblock in self.get_subblocks():
+            subblock.track_provenance = True
+            subblock.block_id = block_ids[subblock.name]
+        for path in get_paths(self.get_graph()):
+            name = path[-1]
+            if len(self.outputs.get(name, [])) > 0:
+                continue
+            self.latency_histograms[tuple(path)] = LatencyHistogram()
+            for processor in [self.processors[name]] + self.processor_replicas.get(name, []):
+                if processor.latency_histograms is None:
+                    processor.latency_histograms = dict()
+                processor.latency_histograms[tuple(block_ids[k] for k in path)] = self.latency_histograms[tuple(path)]
+
+    def set_pull(self, name, policy='any'):
+        '''
+        processor of source block name calls process_value only when consumers of its outputs are ready:
+        assemblers that are hungry and have no pending data, processors of blocks without assembler that wait for input
+        policy any - some consumer is ready, all - every consumer is ready, see Demand
+        '''
+        assert name in self.blocks, name
+        assert not self.blocks[name].use_assembler and not self.blocks[name].skip_assembler, f'block {name} is not a source'
+        assert len(self.outputs.get(name, [])) > 0, f'source block {name} has no outputs'
+        assert policy in DEMAND_POLICIES, policy
+        self.pulls[name] = policy
+
+    def set_demands(self):
+        for name, policy in self.pulls.items():
+            demand = Demand(len(self.outputs[name]), policy=policy)
+            self.processors[name].demand = demand
+            for i, output_name in enumerate(self.outputs[name]):
+                if output_name in self.assemblers:
+                    consumers = [self.assemblers[output_name]]
+                else:
+                    consumers = [self.processors[output_name]] + self.processor_replicas.get(output_name, [])
+                for consumer in consumers:
+                    consumer.demand_slots.append((demand, i))
+
+    def set_latency_budget(self, name, budget_ms):
+        '''
+        assembler and processors of block name drop QueueData with the oldest source timestamp older than budget_ms,
+        processors call process_expired_value instead of process_value, requires provenance=True
+        '''
+        assert self.provenance, 'latency budget requires pipeline with provenance=True'
+        assert name in self.blocks, name
+        assert budget_ms > 0, name
+        self.latency_budgets[name] = budget_ms
+
+    def set_latency_budgets(self):
+        for name, budget_ms in self.latency_budgets.items():
+            subblocks = [d[name] for d in [self.assemblers, self.processors] if name in d]
+            for subblock in subblocks + self.processor_replicas.get(name, []):
+                subblock.latency_budget_ns = int(budget_ms * 1e6)
+                subblock.n_expired = multiprocessing.RawValue('q', 0)
+
+    def get_expired(self):
+        '''
+        number of QueueData that exceeded latency budgets, {(name, subblock type): n}
+        '''
+        result = dict()
+        for name in self.latency_budgets:
+            if name in self.assemblers and self.assemblers[name].n_expired is not None:
+                result[(name, 'assembler')] = self.assemblers[name].n_expired.value
+            processors = [self.processors[name]] + self.processor_replicas.get(name, [])
+            if processors[0].n_expired is not None:
+                result[(name, 'processor')] = sum(v.n_expired.value for v in processors)
+        return result
+
+    def get_latency_histograms(self):
+        '''
+        returns {path of block names: LatencyHistogram} of end-to-end latencies, requires provenance=True
+        '''
+        assert self.provenance, 'pipeline was created with provenance=False'
+        return self.latency_histograms
+
+    def is_pass_through(self, subblock_type, subblock):
+        '''
+        True if the subblock only forwards QueueData and ignores QueueMsg, is detected by identity of its hooks
+        '''
+        subblock_class = type(subblock)
+        if subblock_type == 'assembler':
+            return (
+                subblock_class.process_queue_els is NoSkipAssembler.process_queue_els
+                and subblock_class.custom_run is Assembler.custom_run
+            )
+        elif subblock_type == 'processor':
+            return (
+                subblock_class.process_value is DummyProcessor.process_value
+                and subblock_class.custom_run is Processor.custom_run
+                and subblock_class.route is Processor.route
+            )
+        return (
+            subblock_class.process_queue_el is DummyDissembler.process_queue_el
+            and subblock_class.custom_run is Dissembler.custom_run
+        )
+
+    def get_put_sites(self, q):
+        '''
+        (subblock, attribute, list index or None) of every output queue of subblocks that puts into q
+        '''
+        result = []
+        for subblock in self.get_subblocks():
+            for attr in ['output_queue', 'output_queues']:
+                value = getattr(subblock, attr, None)
+                for i, v in enumerate(value) if isinstance(value, list) else [(None, value)]:
+                    if v is q or (isinstance(v, RelabelQueue) and len(v.queues) == 1 and v.queues[0] is q):
+                        result.append((subblock, attr, i))
+        return result
+
+    def set_put_site(self, subblock, attr, i, q):
+        if i is None:
+            setattr(subblock, attr, q)
+        else:
+            getattr(subblock, attr)[i] = q
+
+    def count_processes(self):
+        n = sum(1 for v in self.get_subblocks() if v.backend == 'process' and not self.blocks[v.name].fused)
+        n += sum(1 for v in self.blocks.values() if v.fused)
+        # MsgProcessor
+        return n if self.control_plane else n + 1
+
+    def get_hops(self):
+        '''
+        {input to output path: number of queues a QueueData passes from the source processor to the last subblock}
+        '''
+        result = dict()
+        for path in get_paths(self.get_graph()):
+            n_subblocks = 0
+            for name in path:
+                n_subblocks += sum(1 for d in [self.assemblers, self.processors, self.reorderers, self.dissemblers] if name in d)
+            result[tuple(path)] = n_subblocks - 1
+        return result
+
+    def compile(self):
+        '''
+        removes pass-through subblocks and rewires queues around them, returns the execution plan
+        {'eliminated': [(name, subblock type)], 'processes': (before, after), 'hops': {path: (before, after)}}
+        NoSkipAssembler, DummyProcessor and DummyDissembler with one output are removed only where downstream subblocks
+        receive the same QueueData: not in fused, input or result blocks, not with provenance, latency budgets,
+        bounded or mailbox inputs, replicas, pulled inputs, cache or capture,
+        upstream subblocks put into the next queue through RelabelQueue that names QueueData as the removed subblock did
+        is called by start if optimize=True, could be called before start after all set_ methods to get the plan
+        '''
+        if self.plan is not None:
+            return self.plan
+        processes = self.count_processes()
+        hops = self.get_hops()
+        eliminated = []
+        # MsgProcessor routes, processors behind removed assemblers take MetaMsg from their new input queue
+        processor_routes = dict(self.processor_queues)
+
+        for name, dissembler in list(self.dissemblers.items()):
+            if self.blocks[name].fused or len(dissembler.output_queues) != 1:
+                continue
+            if not self.is_pass_through('dissembler', dissembler):
+                continue
+            # DummyDissembler copies QueueData without renaming
+            for site in self.get_put_sites(dissembler.input_queue):
+                self.set_put_site(*site, dissembler.output_queues[0])
+            del self.dissemblers[name]
+            eliminated.append((name, 'dissembler'))
+
+        for name, assembler in list(self.assemblers.items()):
+            block = self.blocks[name]
+            if block.fused or block.mailbox or self.provenance or name in self.latency_budgets:
+                continue
+            # bounded inputs keep their assembler, it takes QueueData only while the processor is hungry
+            if isinstance(assembler.input_queue, BoundedQueue) or not self.is_pass_through('assembler', assembler):
+                continue
+            for site in self.get_put_sites(assembler.input_queue):
+                self.set_put_site(*site, RelabelQueue([assembler.input_queue], name=name))
+            for processor in [self.processors[name]] + self.processor_replicas[name]:
+                processor.input_queue = assembler.input_queue
+                processor.assembler_input_queue = None
+            processor_routes[name] = assembler.input_queue
+            del self.assemblers[name]
+            eliminated.append((name, 'assembler'))
+
+        pulled = {k for name in self.pulls for k in self.outputs[name]}
+        for name, processor in list(self.processors.items()):
+            if (
+                self.blocks[name].fused or name == self.input_name or name in self.result_names 
+                or name in self.assemblers or name in pulled or name in self.latency_budgets or self.provenance
+                or len(self.processor_replicas[name]) > 0 or processor.deepcopy
+                or processor.cache is not None or processor.capture_fp is not None
+            ):
+                continue
+            if processor.input_queue is None or isinstance(processor.input_queue, (BoundedQueue, Mailbox)):
+                continue
+            if processor.output_queue is None or not self.is_pass_through('processor', processor):
+                continue
+            output_queues = processor.output_queue if isinstance(processor.output_queue, list) else [processor.output_queue]
+            sites = self.get_put_sites(processor.input_queue)
+            # RingQueue has a single producer
+            if len(sites) == 0 or (len(sites) > 1 and any(isinstance(q, RingQueue) for q in output_queues)):
+                continue
+            for site in sites:
+                self.set_put_site(*site, RelabelQueue(output_queues, name=name))
+            del self.processors[name]
+            eliminated.append((name, 'processor'))
+
+        self.msg_processor.eliminated = set(eliminated)
+        for name, processor in self.processors.items():
+            assert processor.input_queue is None or processor_routes[name] is processor.input_queue, \
+                f'MetaMsg for processor of block {name} would not reach its input queue'
+        self.msg_processor.queues['processor'] = processor_routes
+        self.plan = {
+            'eliminated': eliminated,
+            'processes': (processes, self.count_processes()),
+            'hops': {k: (v, self.get_hops()[k]) for k, v in hops.items()}
+        }
+        return self.plan
+
+    def set_control_plane(self):
+        '''
+        gives every assembler, processor and dissembler a ControlChannel, replicas of a processor share one,
+        msg_queue of the pipeline and subblocks is replaced by ControlRouter, so MetaMsg take one hop
+        is called after localize_queues, subblocks with a local input queue poll the channel instead of being woken
+        '''
+        routes = dict()
+        for subblock_type, subblocks in [
+            ('assembler', self.assemblers),
+            ('processor', self.processors),
+            ('dissembler', self.dissemblers)
+        ]:
+            for name, subblock in subblocks.items():
+                channel = ControlChannel()
+                if subblock.input_queue is not None and not isinstance(subblock.input_queue, queue.Queue):
+                    channel.wake_queue = subblock.input_queue
+                receivers = [subblock]
+                if subblock_type == 'processor':
+                    receivers.extend(self.processor_replicas.get(name, []))
+                for receiver in receivers:
+                    receiver.control = channel
+                routes[(subblock_type, name)] = channel
+        if self.plan is not None:
+            for name, subblock_type in self.plan['eliminated']:
+                routes[(subblock_type, name)] = None
+        self.control_router = ControlRouter(routes)
+        self.msg_queue = self.control_router
+        for subblock in self.get_subblocks():
+            subblock.msg_queue = self.control_router
+
+    def get_subblocks(self):
+        result = []
+        for d in [self.assemblers, self.processors, self.dissemblers, self.reorderers]:
+            result.extend(d.values())
+        for v in self.processor_replicas.values():
+            result.extend(v)
+        return result
+
+    def localize_queues(self):
+        '''
+        replaces multiprocessing queues that are used only by subblocks running in the pipeline process with queue.Queue
+        '''
+        queue_attrs = ['input_queue', 'output_queue', 'assembler_input_queue', 'output_queues', 'drop_queue']
+        local = dict()
+        queues = dict()
+        for subblock in self.get_subblocks():
+            for attr in queue_attrs:
+                value = getattr(subblock, attr, None)
+                for q in value if isinstance(value, list) else [value]:
+                    # RelabelQueue of Pipeline.compile puts into the queues it wraps
+                    for q in q.queues if isinstance(q, RelabelQueue) else [q]:
+                        if isinstance(q, (multiprocessing.queues.Queue, SharedMemoryQueue, RingQueue)):
+                            local[id(q)] = local.get(id(q), True) and subblock.backend != 'process'
+                            queues[id(q)] = q
+        replacements = {k: queue.Queue() for k, v in local.items() if v}
+        
+        def replace(q):
+            if isinstance(q, RelabelQueue):
+                q.queues = [replace(v) for v in q.queues]
+                return q
+            return replacements.get(id(q), q)
+
+        for subblock in self.get_subblocks():
+            for attr in queue_attrs:
+                value = getattr(subblock, attr, None)
+                if isinstance(value, list):
+                    setattr(subblock, attr, [replace(q) for q in value])
+                elif value is not None:
+                    setattr(subblock, attr, replace(value))
+        for queues_dict in self.msg_processor.queues.values():
+            for k, v in queues_dict.items():
+                queues_dict[k] = replace(v)
+        for k in replacements:
+            if isinstance(queues[k], RingQueue):
+                queues[k].unlink()
+
+    def start(self, log_dirpath=None, log_format='text', trace_capacity=1 << 20):
+        if self.optimize:
+            self.compile()
+        self.set_loggers(log_dirpath, log_format=log_format, trace_capacity=trace_capacity)
+        if self.provenance:
+            self.set_provenance()
+            self.set_latency_budgets()
+        self.set_demands()
+        if len(self.result_names) > 0:
+            self.check_result_paths()
+        if self.metrics_port is not None:
+            for subblock in self.get_subblocks():
+                subblock.metrics = SubBlockMetrics()
+        if self.debug_payloads:
+            for subblock in self.get_subblocks():
+                subblock.debug_payloads = True
+        use_threads = any(v.backend != 'process' for v in self.get_subblocks())
+        if use_threads:
+            self.localize_queues()
+        if self.control_plane:
+            self.set_control_plane()
+        if any(v.backend == 'asyncio' for v in self.get_subblocks()):
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name='pipeline_event_loop', daemon=True).start()
+        for name, block in self.blocks.items():
+            if block.fused:
+                self.fused_blocks[name] = FusedBlock(
+                    name, 
+                    assembler=self.assemblers.get(name), 
+                    processor=self.processors[name], 
+                    dissembler=self.dissemblers.get(name)
+                )
+                self.fused_blocks[name].start()
+                continue
+            subblocks = [d[name] for d in [self.assemblers, self.processors, self.dissemblers, self.reorderers] if name in d]
+            for subblock in subblocks + self.processor_replicas.get(name, []):
+                if subblock.backend == 'process':
+                    subblock.start()
+                else:
+                    if subblock.backend == 'asyncio':
+                        subblock.loop = self.loop
+                    thread = threading.Thread(target=subblock.run, name=subblock.subblock_name)
+                    thread.start()
+                    self.threads.append(thread)
+        if self.control_plane:
+            # MetaMsg are delivered by ControlRouter
+            pass
+        elif use_threads:
+            # msg processor should be able to put into queues of the pipeline process
+            thread = threading.Thread(target=self.msg_processor.run, name='MsgProcessor', daemon=True)
+            thread.start()
+        else:
+            self.msg_processor.start()
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self, self.metrics_port)
+            self.metrics_server.start()
+
+    def get_metrics(self):
+        '''
+        metrics in Prometheus text format, requires metrics_port
+        '''
+        assert self.metrics_port is not None, 'pipeline was created without metrics_port'
+        return get_metrics_text(self)
+
+    def terminate(self):
+        '''
+        terminates processes of the pipeline, subblocks with thread or asyncio backend keep running
+        '''
+        processes = [v for v in self.get_subblocks() if v.backend == 'process' and v.pid is not None]
+        processes.extend(self.fused_blocks.values())
+        if self.msg_processor.pid is not None:
+            processes.append(self.msg_processor)
+        for v in processes:
+            v.terminate()
+        for v in processes:
+            v.join()
+        self.close()
+
+    def close(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        for v in list(self.processor_queues.values()) + list(self.dissembler_queues.values()):
+            if isinstance(v, (Mailbox, RingQueue)):
+                v.unlink()
+        if self.shm_pool is not None:
+            self.shm_pool.unlink()
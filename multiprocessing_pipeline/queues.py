@@ -0,0 +1,386 @@
+import multiprocessing
+import pickle
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .subblocks import QueueData, QueueMsg
+
+
+POLICIES = ('block', 'drop_oldest', 'drop_newest', 'latest')
+RING_WRAP = -1
+
+
+class BoundedQueue:
+    '''
+    queue with a sub-queue for every producer, limits {producer_name: (capacity, policy)} bound the number of
+    QueueData queued by a producer, producers without limits are unbounded, what happens on put to a full sub-queue:
+    block - wait until there is space, drop_newest - drop put QueueData, drop_oldest - drop the oldest queued QueueData
+    latest - drop all queued QueueData on every put
+    dropped QueueData are taken out of the sub-queue by put, QueueMsg are neither counted nor dropped and are taken first
+    '''
+    def __init__(self, limits, pool=None):
+        for k, (capacity, policy) in limits.items():
+            assert capacity > 0, f'capacity of {k} should be positive'
+            assert policy in POLICIES, f'unknown policy {policy} for {k}'
+        self.limits = limits
+        self.pool = pool
+        # None is the sub-queue of producers without limits
+        self.names = list(limits) + [None]
+        self.queues = {k: multiprocessing.Queue() for k in self.names}
+        self.msgs = multiprocessing.Queue()
+        self.cond = multiprocessing.Condition()
+        self.n_queued = {k: multiprocessing.RawValue('q', 0) for k in self.names}
+        self.n_total = multiprocessing.RawValue('q', 0)
+        self.n_msgs = multiprocessing.RawValue('q', 0)
+        self.n_dropped = {k: multiprocessing.RawValue('q', 0) for k in limits}
+        # sub-queue get starts from, producers are taken round robin
+        self.i = 0
+
+    def evict(self, name, n):
+        '''
+        takes n oldest QueueData out of the sub-queue of name, should be called with cond acquired
+        '''
+        dropped = []
+        for _ in range(n):
+            # counted QueueData are in the sub-queue or on the way from the feeder thread of their producer
+            dropped.append(self.queues[name].get())
+        self.n_queued[name].value -= n
+        self.n_total.value -= n
+        self.n_dropped[name].value += n
+        return dropped
+
+    def put(self, el, block=True, timeout=None):
+        if not isinstance(el, QueueData):
+            with self.cond:
+                self.msgs.put(el)
+                self.n_msgs.value += 1
+                self.cond.notify_all()
+            return
+        name = el.name if el.name in self.limits else None
+        capacity, policy = self.limits[name] if name is not None else (None, 'block')
+        if self.pool is not None:
+            el = self.pool.encode_queue_el(el)
+        put = True
+        dropped = []
+        with self.cond:
+            n_queued = self.n_queued[name]
+            if capacity is not None and n_queued.value >= capacity:
+                if policy == 'block':
+                    put = self.cond.wait_for(lambda: n_queued.value < capacity, timeout if block else 0)
+                elif policy == 'drop_newest':
+                    self.n_dropped[name].value += 1
+                    put = False
+                else:
+                    dropped = self.evict(name, n_queued.value - capacity + 1)
+            if put:
+                if policy == 'latest':
+                    dropped += self.evict(name, n_queued.value)
+                self.queues[name].put(el)
+                n_queued.value += 1
+                self.n_total.value += 1
+                self.cond.notify_all()
+        if not put:
+            dropped.append(el)
+        if self.pool is not None:
+            # releases shared memory slots of the dropped QueueData
+            for v in dropped:
+                self.pool.decode_queue_el(v)
+        if not put and policy == 'block':
+            raise queue.Full
+
+    def get(self, block=True, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(
+                lambda: self.n_total.value > 0 or self.n_msgs.value > 0,
+                timeout if block else 0
+            ):
+                raise queue.Empty
+            if self.n_msgs.value > 0:
+                self.n_msgs.value -= 1
+                el = self.msgs.get()
+            else:
+                for j in range(len(self.names)):
+                    name = self.names[(self.i + j) % len(self.names)]
+                    if self.n_queued[name].value > 0:
+                        break
+                self.i = (self.i + j + 1) % len(self.names)
+                el = self.queues[name].get()
+                self.n_queued[name].value -= 1
+                self.n_total.value -= 1
+                self.cond.notify_all()
+        if self.pool is not None:
+            el = self.pool.decode_queue_el(el)
+        return el
+
+    def get_msg(self, block=True, timeout=None):
+        '''
+        get of QueueMsg only, QueueData stay queued and keep their producers bounded
+        '''
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.n_msgs.value > 0, timeout if block else 0):
+                raise queue.Empty
+            self.n_msgs.value -= 1
+            return self.msgs.get()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self, el):
+        return self.put(el, False)
+
+    def qsize(self):
+        return self.n_total.value + self.n_msgs.value
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def dropped(self):
+        return {k: v.value for k, v in self.n_dropped.items()}
+
+
+class Mailbox:
+    '''
+    single slot "latest wins" queue, put of a QueueData overwrites the one that was not taken yet
+    QueueMsg are never overwritten and are taken before data
+    pickled QueueData should fit into capacity bytes
+    '''
+    # put pickles QueueData before it returns, see WindowAssembler
+    copies_on_put = True
+
+    def __init__(self, capacity=1 << 24, pool=None):
+        self.capacity = capacity
+        self.pool = pool
+        self.shm = shared_memory.SharedMemory(create=True, size=capacity)
+        self.cond = multiprocessing.Condition()
+        # size of pickled QueueData in the slot, 0 if the slot is empty
+        self.size = multiprocessing.RawValue('q', 0)
+        self.n_msgs = multiprocessing.RawValue('q', 0)
+        self.n_dropped = multiprocessing.RawValue('q', 0)
+        self.msgs = multiprocessing.Queue()
+
+    def put(self, el, block=True, timeout=None):
+        if isinstance(el, QueueMsg):
+            with self.cond:
+                self.msgs.put(el)
+                self.n_msgs.value += 1
+                self.cond.notify()
+            return
+        if self.pool is not None:
+            el = self.pool.encode_queue_el(el)
+        data = pickle.dumps(el, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.capacity:
+            raise Exception(f'{len(data)} bytes do not fit into mailbox of {self.capacity} bytes')
+        dropped_data = None
+        with self.cond:
+            if self.size.value > 0:
+                self.n_dropped.value += 1
+                if self.pool is not None:
+                    dropped_data = bytes(self.shm.buf[:self.size.value])
+            self.shm.buf[:len(data)] = data
+            self.size.value = len(data)
+            self.cond.notify()
+        if dropped_data is not None:
+            # releases shared memory slots of the overwritten QueueData
+            self.pool.decode_queue_el(pickle.loads(dropped_data))
+
+    def get(self, block=True, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(
+                lambda: self.size.value > 0 or self.n_msgs.value > 0,
+                timeout if block else 0
+            ):
+                raise queue.Empty
+            if self.n_msgs.value > 0:
+                self.n_msgs.value -= 1
+                data = None
+            else:
+                data = bytes(self.shm.buf[:self.size.value])
+                self.size.value = 0
+        if data is None:
+            return self.msgs.get()
+        el = pickle.loads(data)
+        if self.pool is not None:
+            el = self.pool.decode_queue_el(el)
+        return el
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self, el):
+        return self.put(el, False)
+
+    def qsize(self):
+        '''
+        at most one QueueData waits in the mailbox, depth is 0 or 1 by design plus the number of QueueMsg
+        '''
+        return int(self.size.value > 0) + self.n_msgs.value
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RingQueue:
+    '''
+    single producer single consumer queue of pickled QueueEl in a shared memory ring buffer of capacity bytes
+    data is written and read without locks, get polls spin times before it blocks until put wakes it,
+    waiting and waking take wait_lock, so a put is never missed and a blocked get does not poll
+    QueueMsg could be put by any process, they go through a side queue and are taken before data
+    '''
+    # put pickles QueueData before it returns, see WindowAssembler
+    copies_on_put = True
+
+    def __init__(self, capacity=1 << 22, spin=0, pool=None):
+        self.capacity = (capacity + 7) // 8 * 8
+        self.spin = spin
+        self.pool = pool
+        # head and tail are total numbers of read and written bytes, each written by one side only
+        self.shm = shared_memory.SharedMemory(create=True, size=16 + self.capacity)
+        self.positions = None
+        # numbers of put and taken records, each written by one side
+        self.n_records = multiprocessing.RawArray('q', 2)
+        self.waiting = multiprocessing.RawValue('b', 0)
+        self.wait_lock = multiprocessing.Lock()
+        self.wakeup = multiprocessing.Semaphore(0)
+        self.n_msgs = multiprocessing.Value('q', 0)
+        self.msgs = multiprocessing.Queue()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['positions'] = None
+        return state
+
+    def get_positions(self):
+        if self.positions is None:
+            self.positions = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        return self.positions
+
+    def notify(self):
+        # the lock orders the written tail before the check of waiting
+        with self.wait_lock:
+            wake = self.waiting.value
+            self.waiting.value = 0
+        if wake:
+            self.wakeup.release()
+
+    def is_empty(self, positions):
+        return int(positions[0]) == int(positions[1]) and self.n_msgs.value == 0
+
+    def put(self, el, block=True, timeout=None):
+        if isinstance(el, QueueMsg):
+            with self.n_msgs.get_lock():
+                self.msgs.put(el)
+                self.n_msgs.value += 1
+            self.notify()
+            return
+        if self.pool is not None:
+            el = self.pool.encode_queue_el(el)
+        data = pickle.dumps(el, protocol=pickle.HIGHEST_PROTOCOL)
+        size = (8 + len(data) + 7) // 8 * 8
+        if size > self.capacity:
+            raise Exception(f'{len(data)} bytes do not fit into ring queue of {self.capacity} bytes')
+        positions = self.get_positions()
+        tail = int(positions[1])
+        offset = tail % self.capacity
+        wrap_size = self.capacity - offset if offset + size > self.capacity else 0
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        delay = 1e-5
+        while self.capacity - (tail - int(positions[0])) < wrap_size + size:
+            if not block or (deadline is not None and time.perf_counter() > deadline):
+                raise queue.Full
+            time.sleep(delay)
+            delay = min(2 * delay, 1e-3)
+        buf = self.shm.buf
+        if wrap_size > 0:
+            buf[16 + offset:16 + offset + 8] = RING_WRAP.to_bytes(8, 'little', signed=True)
+            offset = 0
+        buf[16 + offset:16 + offset + 8] = len(data).to_bytes(8, 'little', signed=True)
+        buf[16 + offset + 8:16 + offset + 8 + len(data)] = data
+        positions[1] = tail + wrap_size + size
+        self.n_records[0] += 1
+        self.notify()
+
+    def get(self, block=True, timeout=None):
+        positions = self.get_positions()
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        i = 0
+        while True:
+            if self.n_msgs.value > 0:
+                with self.n_msgs.get_lock():
+                    self.n_msgs.value -= 1
+                return self.msgs.get()
+            head = int(positions[0])
+            if head != int(positions[1]):
+                break
+            if not block:
+                raise queue.Empty
+            if i < self.spin:
+                i += 1
+                continue
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            with self.wait_lock:
+                if not self.is_empty(positions):
+                    continue
+                self.waiting.value = 1
+            if not self.wakeup.acquire(timeout=remaining):
+                with self.wait_lock:
+                    self.waiting.value = 0
+        buf = self.shm.buf
+        offset = head % self.capacity
+        length = int.from_bytes(buf[16 + offset:16 + offset + 8], 'little', signed=True)
+        if length == RING_WRAP:
+            head += self.capacity - offset
+            offset = 0
+            length = int.from_bytes(buf[16:24], 'little', signed=True)
+        el = pickle.loads(buf[16 + offset + 8:16 + offset + 8 + length])
+        positions[0] = head + (8 + length + 7) // 8 * 8
+        self.n_records[1] += 1
+        if self.pool is not None:
+            el = self.pool.decode_queue_el(el)
+        return el
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self, el):
+        return self.put(el, False)
+
+    def qsize(self):
+        # the counters are updated after the positions, a record could be taken before its put is counted
+        return max(self.n_records[0] - self.n_records[1], 0) + self.n_msgs.value
+
+    def empty(self):
+        return self.is_empty(self.get_positions())
+
+    def unlink(self):
+        self.positions = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RelabelQueue:
+    '''
+    put side that replaces a pass-through subblock removed by Pipeline.compile,
+    QueueData are put into every queue of queues, with name set to name as the removed subblock would if name is not None
+    '''
+    def __init__(self, queues, name=None):
+        assert len(queues) > 0
+        self.queues = queues
+        self.name = name
+
+    def put(self, el, block=True, timeout=None):
+        if isinstance(el, QueueData) and self.name is not None:
+            el = QueueData(name=self.name, index=el.index, value=el.value, provenance=el.provenance)
+        for q in self.queues:
+            q.put(el, block, timeout)
+
+    def put_nowait(self, el):
+        return self.put(el, False)
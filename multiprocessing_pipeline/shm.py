@@ -0,0 +1,184 @@
+import multiprocessing
+import weakref
+from copy import copy
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .subblocks import QueueData, QueueSeq
+
+
+class ShmHandle:
+    '''
+    small picklable reference to an ndarray stored in a SharedMemoryPool slot
+    '''
+    def __init__(self, slot, offset, shape, strides, dtype):
+        self.slot = slot
+        self.offset = offset
+        self.shape = shape
+        self.strides = strides
+        self.dtype = dtype
+
+
+class SlotRef:
+    '''
+    base object of every ndarray view of a pool slot, the slot is released when the last view is collected
+    '''
+    def __init__(self, pool, slot, array):
+        self.pool = pool
+        self.slot = slot
+        self.array = array
+        self.__array_interface__ = array.__array_interface__
+        weakref.finalize(self, pool.release, slot)
+
+
+class SharedMemoryPool:
+    '''
+    fixed number of equally sized shared memory slots with reference counts shared between processes
+    ndarrays of at least min_nbytes are copied into a free slot on put and are received as read-only zero-copy views,
+    a subblock that modifies its input in place should copy it, see payload.thaw
+    if no slot is free or the array does not fit a slot the array is pickled as usual
+    '''
+    def __init__(self, n_slots, slot_size, min_nbytes=1 << 16):
+        assert n_slots > 0 and slot_size > 0
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self.min_nbytes = min_nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * slot_size)
+        self.refcounts = multiprocessing.Array('i', n_slots)
+        self.buffer = None
+        self.next_slot = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffer'] = None
+        return state
+
+    def get_buffer(self):
+        if self.buffer is None:
+            self.buffer = np.ndarray((self.n_slots * self.slot_size,), dtype=np.uint8, buffer=self.shm.buf)
+        return self.buffer
+
+    def allocate(self):
+        with self.refcounts.get_lock():
+            for i in range(self.n_slots):
+                slot = (self.next_slot + i) % self.n_slots
+                if self.refcounts[slot] == 0:
+                    self.refcounts[slot] = 1
+                    self.next_slot = (slot + 1) % self.n_slots
+                    return slot
+        return None
+
+    def incref(self, slot):
+        with self.refcounts.get_lock():
+            assert self.refcounts[slot] > 0, slot
+            self.refcounts[slot] += 1
+
+    def release(self, slot):
+        with self.refcounts.get_lock():
+            assert self.refcounts[slot] > 0, slot
+            self.refcounts[slot] -= 1
+
+    def n_used(self):
+        with self.refcounts.get_lock():
+            return sum(1 for v in self.refcounts if v > 0)
+
+    def find_slot_ref(self, x):
+        while isinstance(x, np.ndarray):
+            x = x.base
+        if isinstance(x, SlotRef) and x.pool.shm.name == self.shm.name:
+            return x
+        return None
+
+    def encode(self, x):
+        if isinstance(x, np.ndarray):
+            slot_ref = self.find_slot_ref(x)
+            if slot_ref is not None:
+                self.incref(slot_ref.slot)
+                offset = x.__array_interface__['data'][0] - slot_ref.__array_interface__['data'][0]
+                return ShmHandle(slot_ref.slot, offset, x.shape, x.strides, x.dtype.str)
+            if x.dtype.hasobject or x.nbytes < self.min_nbytes or x.nbytes > self.slot_size:
+                return x
+            slot = self.allocate()
+            if slot is None:
+                return x
+            start = slot * self.slot_size
+            dst = np.ndarray(x.shape, dtype=x.dtype, buffer=self.get_buffer()[start:start + x.nbytes])
+            np.copyto(dst, x)
+            return ShmHandle(slot, 0, dst.shape, dst.strides, dst.dtype.str)
+        elif isinstance(x, dict):
+            return {k: self.encode(v) for k, v in x.items()}
+        elif isinstance(x, list):
+            return [self.encode(v) for v in x]
+        elif isinstance(x, tuple):
+            return tuple(self.encode(v) for v in x)
+        else:
+            return x
+
+    def decode(self, x):
+        if isinstance(x, ShmHandle):
+            start = x.slot * self.slot_size
+            slot_array = self.get_buffer()[start:start + self.slot_size]
+            slot_ref = SlotRef(self, x.slot, slot_array)
+            result = np.ndarray(
+                x.shape, dtype=np.dtype(x.dtype),
+                buffer=np.asarray(slot_ref), offset=x.offset, strides=x.strides
+            )
+            # forwarded views share the slot with consumers of other outputs, writes in place would change their data
+            result.flags.writeable = False
+            return result
+        elif isinstance(x, dict):
+            return {k: self.decode(v) for k, v in x.items()}
+        elif isinstance(x, list):
+            return [self.decode(v) for v in x]
+        elif isinstance(x, tuple):
+            return tuple(self.decode(v) for v in x)
+        else:
+            return x
+
+    def encode_queue_el(self, el):
+        if isinstance(el, QueueData):
+            value = self.encode(el.value)
+            el = copy(el)
+            el.value = value
+        elif isinstance(el, QueueSeq) and el.el is not None:
+            el = QueueSeq(seq=el.seq, el=self.encode_queue_el(el.el))
+        return el
+
+    def decode_queue_el(self, el):
+        if isinstance(el, QueueData):
+            el.value = self.decode(el.value)
+        elif isinstance(el, QueueSeq) and el.el is not None:
+            self.decode_queue_el(el.el)
+        return el
+
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedMemoryQueue:
+    '''
+    multiprocessing.Queue that sends ndarrays of QueueData values through a SharedMemoryPool
+    '''
+    def __init__(self, pool, queue=None):
+        self.pool = pool
+        self.queue = multiprocessing.Queue() if queue is None else queue
+
+    def put(self, el, *args, **kwargs):
+        self.queue.put(self.pool.encode_queue_el(el), *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self.pool.decode_queue_el(self.queue.get(*args, **kwargs))
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self, el):
+        return self.put(el, False)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def empty(self):
+        return self.queue.empty()
@@ -1,10 +1,26 @@
+import asyncio
+import inspect
 import logging
 import multiprocessing
+import queue
+import time
 import traceback
-from copy import deepcopy
+from copy import copy, deepcopy
+
+import numpy as np
+
+from .tracing import Tracer
+from .join import IndexJoin
+from .payload import freeze, fingerprint
+from .capture import CaptureWriter, CaptureReader
 
 
 PROCESSOR_FED = 'processor_fed'
+REPLAY_MODES = ('original', 'fixed', 'fast')
+# wakes a subblock blocked on its input queue to handle a control message, see control.ControlChannel
+CONTROL_WAKE = 'control_wake'
+# QueueMsg (RESULT_DROPPED, index) tells the pipeline process that the value of index gives no result, see Pipeline.set_result
+RESULT_DROPPED = 'result_dropped'
 
 
 class QueueEl:
@@ -13,7 +29,11 @@ class QueueEl:
 
 
 class QueueData(QueueEl):
-    def __init__(self, name, index, value):
+    '''
+    provenance is None or a list of lineages (block ids, perf_counter_ns times) of blocks the data went through,
+    the first time is the source timestamp, every processor adds a hop, assemblers merge lineages of inputs
+    '''
+    def __init__(self, name, index, value, provenance=None):
         QueueEl.__init__(self)
 
         assert isinstance(name, str)
@@ -25,6 +45,8 @@ class QueueData(QueueEl):
         assert value is not None, self.name
         self.value = value
 
+        self.provenance = provenance
+
     def __str__(self):
         return f'name: {self.name}, index: {self.index}, value: {self.value}'
 
@@ -40,6 +62,21 @@ class QueueMsg(QueueEl):
         return f'msg: {self.msg}'
 
 
+class QueueSeq(QueueEl):
+    '''
+    output of a processor replica, el is None if the replica produced nothing for sequence number seq
+    '''
+    def __init__(self, seq, el):
+        QueueEl.__init__(self)
+
+        assert isinstance(seq, int)
+        self.seq = seq
+        self.el = el
+
+    def __str__(self):
+        return f'seq: {self.seq}, el: {self.el}'
+
+
 class SubBlock(multiprocessing.Process):
     def __init__(self, name, msg_queue, input_queue=None, output_queue=None):
         multiprocessing.Process.__init__(self)
@@ -50,10 +87,34 @@ class SubBlock(multiprocessing.Process):
         self.output_queue = output_queue
         self.logger = None
         self.logger_fp = None
+        self.tracer = None
+        self.tracer_fp = None
+        self.tracer_capacity = None
+        # one of pipeline.BACKENDS, set by Pipeline
+        self.backend = 'process'
+        # event loop that runs coroutine hooks, shared by subblocks with asyncio backend
+        self.loop = None
+        # QueueData.provenance tracking, set by Pipeline
+        self.track_provenance = False
+        self.block_id = None
+        # SubBlockMetrics, set by Pipeline
+        self.metrics = None
+        # QueueData older than latency_budget_ns since the source timestamp are expired, set by Pipeline
+        self.latency_budget_ns = None
+        self.n_expired = None
+        # (Demand, consumer index) of pulled source blocks this subblock consumes from, set by Pipeline
+        self.demand_slots = []
+        # values are handed along without copying, debug mode checks that nobody modifies them, set by Pipeline
+        self.debug_payloads = False
+        self.handed_off = None
+        # ControlChannel of MetaMsg sent to the subblock, set by Pipeline with control_plane=True
+        self.control = None
 
     def set_logger(self):
         if self.logger_fp is not None:
-            self.logger = logging.getLogger()
+            # logger per file, subblocks could share a process
+            self.logger = logging.getLogger(self.logger_fp)
+            self.logger.propagate = False
             self.logger.setLevel(logging.INFO)
             fh = logging.FileHandler(self.logger_fp, mode='w')
             fh.setFormatter(logging.Formatter(
@@ -62,10 +123,17 @@ class SubBlock(multiprocessing.Process):
             ))
             self.logger.addHandler(fh)
             self.logger.info('set_logger')
+        if self.tracer_fp is not None:
+            self.tracer = Tracer(self.tracer_fp, capacity=self.tracer_capacity)
+            self.tracer.record('set_logger', None)
 
     def set_logger_fp(self, fp):
         self.logger_fp = fp
 
+    def set_tracer_fp(self, fp, capacity=1 << 20):
+        self.tracer_fp = fp
+        self.tracer_capacity = capacity
+
     def get_log_msg(self, data):
         if data is None:
             return str(None)
@@ -87,9 +155,113 @@ class SubBlock(multiprocessing.Process):
             raise Exception(f'data type {type(data)} not recognized')
 
     def log(self, msg, data):
+        if self.metrics is not None:
+            self.metrics.record(msg, data)
+        if self.tracer is not None:
+            self.tracer.record(msg, data)
         if self.logger is not None:
             self.logger.info(f'{msg} {self.get_log_msg(data)}')
 
+    def count_dropped(self, n=1):
+        '''
+        counts QueueData the subblock skipped
+        '''
+        if self.metrics is not None and n > 0:
+            self.metrics.count_dropped(n)
+
+    def is_expired(self, queue_el):
+        '''
+        True if the oldest source timestamp of QueueData provenance is older than the latency budget
+        '''
+        if self.latency_budget_ns is None or queue_el.provenance is None:
+            return False
+        age = time.perf_counter_ns() - min(times[0] for _, times in queue_el.provenance)
+        if age <= self.latency_budget_ns:
+            return False
+        if self.n_expired is not None:
+            self.n_expired.value += 1
+        return True
+
+    def request_demand(self):
+        '''
+        tells pulled sources that the subblock is ready to take a QueueData
+        '''
+        for demand, i in self.demand_slots:
+            demand.request(i)
+
+    def get_fingerprint(self, value):
+        return fingerprint(value) if self.debug_payloads else None
+
+    def check_fingerprint(self, value, expected, what):
+        if expected is not None and fingerprint(value) != expected:
+            raise Exception(
+                f'{what} was modified in place in subblock {self.subblock_name}, '
+                f'values are shared without copying, use payload.thaw to get a writable copy'
+            )
+
+    def hand_off(self, value):
+        '''
+        in debug mode freezes an output value and checks that the previous output was not modified after it was handed off
+        '''
+        if not self.debug_payloads:
+            return
+        if self.handed_off is not None:
+            self.check_fingerprint(*self.handed_off, 'value handed off before')
+        freeze(value)
+        self.handed_off = (value, fingerprint(value))
+
+    def poll_control(self):
+        '''
+        handles control messages sent to the subblock before queued data
+        '''
+        if self.control is None:
+            return
+        for msg in self.control.poll():
+            self.process_control(QueueMsg(msg=msg))
+
+    def process_control(self, queue_msg):
+        pass
+
+    def get_input(self, timeout=None, data=True):
+        '''
+        input_queue.get that handles control messages first and while it waits,
+        raises queue.Empty if timeout is not None and nothing was received in timeout seconds
+        data=False takes only QueueMsg, the input queue should be a BoundedQueue
+        '''
+        get = self.input_queue.get if data else self.input_queue.get_msg
+        if self.control is None:
+            return get(timeout=timeout)
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            self.poll_control()
+            if not self.control.start_wait():
+                continue
+            get_timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            if self.control.wake_queue is None:
+                get_timeout = self.control.poll_s if get_timeout is None else min(get_timeout, self.control.poll_s)
+            try:
+                queue_el = get(timeout=get_timeout)
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise
+                continue
+            finally:
+                self.control.stop_wait()
+            if not (isinstance(queue_el, QueueMsg) and isinstance(queue_el.msg, str) and queue_el.msg == CONTROL_WAKE):
+                return queue_el
+
+    def resolve(self, result):
+        '''
+        hooks like process_value could be coroutines, they are run on the event loop of the subblock
+        '''
+        if not inspect.isawaitable(result):
+            return result
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        if self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(result, self.loop).result()
+        return self.loop.run_until_complete(result)
+
     def run(self):
         try:
             self.set_logger()
@@ -113,34 +285,80 @@ class Assembler(SubBlock):
     def __init__(self, name, msg_queue, input_queue, output_queue):
         SubBlock.__init__(self, name, msg_queue, input_queue=input_queue, output_queue=output_queue)
         self.hungry_count = 1
+        # False if the output queue is a Mailbox, then processor does not send PROCESSOR_FED
+        # and everything queued is processed at once
+        self.use_handshake = True
+        # index -> lineages of received QueueData, attached to outputs of the same index
+        self.provenances = dict()
+        self.max_provenances = 256
+        # QueueData are taken only while the processor is hungry, so they wait in the bounded input queue, set by Pipeline
+        self.bounded_input = False
+
+    def add_provenance(self, el):
+        if el.provenance is None:
+            return
+        lineages = self.provenances.setdefault(el.index, [])
+        for lineage in el.provenance:
+            if lineage not in lineages:
+                lineages.append(lineage)
+        if len(self.provenances) > self.max_provenances:
+            del self.provenances[next(iter(self.provenances))]
+
+    def set_provenance(self, output_queue_els):
+        '''
+        process_queue_els creates new QueueData, they get merged lineages of inputs with the same index
+        '''
+        max_index = None
+        for el in output_queue_els:
+            if el is not None:
+                if el.provenance is None:
+                    el.provenance = self.provenances.get(el.index)
+                max_index = el.index if max_index is None else max(max_index, el.index)
+        if max_index is not None:
+            for index in [k for k in self.provenances if k <= max_index]:
+                del self.provenances[index]
 
     def custom_run(self):
         while True:
             input_queue_els = []
             while True:
+                if len(input_queue_els) == 0 and (self.hungry_count > 0 or not self.use_handshake):
+                    self.request_demand()
                 self.log('queue_wait', None)
-                input_queue_el = self.input_queue.get()
+                input_queue_el = self.get_input(data=not (self.bounded_input and self.use_handshake and self.hungry_count == 0))
                 self.log('input_queue.get', input_queue_el)
                 if input_queue_el is None:
                     break
                 assert isinstance(input_queue_el, QueueEl), self.subblock_name
                 if isinstance(input_queue_el, QueueMsg) and isinstance(input_queue_el.msg, str) and input_queue_el.msg == PROCESSOR_FED:
                     self.hungry_count += 1
+                    if len(input_queue_els) > 0:
+                        # data collected while processor was busy should not wait for more data
+                        break
                     continue
                 elif isinstance(input_queue_el, QueueMsg):
-                    self.process_queue_els([input_queue_el])
+                    self.resolve(self.process_queue_els([input_queue_el]))
                 elif isinstance(input_queue_el, QueueData):
+                    if self.is_expired(input_queue_el):
+                        continue
                     input_queue_els.append(input_queue_el)
-                    if self.hungry_count > 0:
+                    if self.track_provenance:
+                        self.add_provenance(input_queue_el)
+                    if not self.use_handshake:
+                        if self.input_queue.empty():
+                            break
+                    elif self.hungry_count > 0:
                         break
                 else:
                     raise Exception(f'contact developer, no code for {type(input_queue_el)} in subblock {self.subblock_name}')
-            output_queue_els = self.process_queue_els(input_queue_els)
-            if len(output_queue_els) > 0:
-                self.log('output_queue.put', output_queue_els[-1])
+            output_queue_els = self.resolve(self.process_queue_els(input_queue_els))
+            if self.track_provenance:
+                self.set_provenance(output_queue_els)
             for output_queue_el in output_queue_els:
                 if output_queue_el is not None:
                     assert isinstance(output_queue_el, QueueData)
+                    self.log('output_queue.put', output_queue_el)
+                    self.hand_off(output_queue_el.value)
                     self.output_queue.put(output_queue_el)
                     # self.hungry_count = max(self.hungry_count - 1, 0)
                     self.hungry_count = 0
@@ -149,6 +367,9 @@ class Assembler(SubBlock):
     def process_queue_els(self, **kwargs):
         raise NotImplementedError
 
+    def process_control(self, queue_msg):
+        self.resolve(self.process_queue_els([queue_msg]))
+
 
 class Processor(SubBlock):
     def __init__(
@@ -161,46 +382,261 @@ class Processor(SubBlock):
         SubBlock.__init__(self, name, msg_queue, input_queue=input_queue, output_queue=output_queue)
         self.assembler_input_queue = assembler_input_queue
         self.deepcopy = deepcopy
+        # shared between replicas of the processor, numbers QueueData in the order replicas take them
+        self.seq_counter = None
+        # names of output blocks if output_queue is a list
+        self.outputs = None
+        # lineage block ids -> LatencyHistogram, set by Pipeline for processors without output
+        self.latency_histograms = None
+        # Demand of consumers if the processor is a pulled source, set by Pipeline
+        self.demand = None
+        self.demand_timeout = 0.1
+        # output QueueData are appended to capture_fp if it is not None, set by Pipeline
+        self.capture_fp = None
+        self.capture_writer = None
+        # ValueCache of process_value results, set by Pipeline
+        self.cache = None
+        # result queue of the pipeline if the processor is between the input block and a result block, set by Pipeline
+        self.drop_queue = None
+
+    def get_queue_el(self, timeout=None):
+        '''
+        raises queue.Empty if timeout is not None and nothing was received in timeout seconds
+        '''
+        self.request_demand()
+        self.log('queue_wait', None)
+        seq = None
+        if self.seq_counter is None:
+            queue_el = self.get_input(timeout=timeout)
+        else:
+            with self.seq_counter.get_lock():
+                queue_el = self.get_input(timeout=timeout)
+                if isinstance(queue_el, QueueData):
+                    seq = self.seq_counter.value
+                    self.seq_counter.value += 1
+        if self.assembler_input_queue is not None:
+            self.assembler_input_queue.put(QueueMsg(msg=PROCESSOR_FED))
+        self.log('input_queue.get', queue_el)
+        return queue_el, seq
+
+    def capture(self, queue_el):
+        if self.capture_writer is None:
+            self.capture_writer = CaptureWriter(self.capture_fp)
+        self.capture_writer.write(queue_el.name, queue_el.index, queue_el.value)
+
+    def put_queue_el(self, queue_el, seq=None):
+        if self.capture_fp is not None and queue_el is not None:
+            self.capture(queue_el)
+        if seq is not None:
+            self.output_queue.put(QueueSeq(seq=seq, el=queue_el))
+        elif isinstance(self.output_queue, list):
+            output_queue_els = self.route(queue_el)
+            assert len(output_queue_els) == len(self.output_queue), self.subblock_name
+            for output_queue, output_queue_el in zip(self.output_queue, output_queue_els):
+                if output_queue_el is not None:
+                    output_queue.put(output_queue_el)
+        else:
+            self.output_queue.put(queue_el)
+
+    def extend_provenance(self, provenance):
+        '''
+        adds a hop of this block to every lineage, starts a lineage if the processor is a source
+        '''
+        if not self.track_provenance:
+            return None
+        now = time.perf_counter_ns()
+        if provenance is None:
+            return [((self.block_id,), (now,))]
+        return [(ids + (self.block_id,), times + (now,)) for ids, times in provenance]
+
+    def add_latency(self, provenance):
+        '''
+        counts end-to-end latency of every lineage in the histogram of its path
+        '''
+        if self.latency_histograms is None or provenance is None:
+            return
+        now = time.perf_counter_ns()
+        for ids, times in provenance:
+            histogram = self.latency_histograms.get(ids + (self.block_id,))
+            if histogram is not None:
+                histogram.add((now - times[0]) * 1e-9)
+
+    def route(self, queue_el):
+        '''
+        is used when the block has several outputs and no dissembler,
+        returns QueueData or None for every output in self.outputs
+        '''
+        return [queue_el for _ in range(len(self.output_queue))]
 
     def custom_run(self):
         while True:
+            seq = None
             if self.input_queue is not None:
-                self.log('queue_wait', None)
-                queue_el = self.input_queue.get()
-                if self.assembler_input_queue is not None:
-                    self.assembler_input_queue.put(QueueMsg(msg=PROCESSOR_FED))
-                self.log('input_queue.get', queue_el)
+                queue_el, seq = self.get_queue_el()
                 if queue_el is None:
                     break
                 assert isinstance(queue_el, QueueEl), f'input queue el not recognized in subblock {self.subblock_name}'
                 if isinstance(queue_el, QueueData):
                     index = queue_el.index
-                    value = self.process_value(queue_el.value)
+                    provenance = queue_el.provenance
+                    input_fingerprint = self.get_fingerprint(queue_el.value)
+                    if self.is_expired(queue_el):
+                        value = self.resolve(self.process_expired_value(queue_el.value))
+                    else:
+                        value = self.process_cached(queue_el.value)
+                    self.check_fingerprint(queue_el.value, input_fingerprint, f'input {queue_el.name} {queue_el.index}')
+                    # blocks without outputs and result blocks, see Pipeline.set_result
+                    self.add_latency(provenance)
                     if value is None:
+                        if self.drop_queue is not None:
+                            self.drop_queue.put(QueueMsg(msg=(RESULT_DROPPED, index)))
                         if self.output_queue is None:
                             self.log('output_queue.put', queue_el)
+                        elif seq is not None:
+                            self.put_queue_el(None, seq)
                         continue
                 elif isinstance(queue_el, QueueMsg):
-                    self.process_value(queue_el)
+                    self.resolve(self.process_value(queue_el))
                     continue
                 else:
                     raise Exception(f'contact developer, no code for {type(queue_el)} in subblock {self.subblock_name}')
             else:
-                process_result = self.process_value()
+                self.poll_control()
+                if self.demand is not None and not self.demand.wait(self.demand_timeout):
+                    continue
+                process_result = self.resolve(self.process_value())
                 if process_result is None:
                     continue
                 index, value = process_result
+                provenance = None
             if self.output_queue is not None:
-                queue_el = QueueData(name=self.name, index=index, value=value)
+                queue_el = QueueData(name=self.name, index=index, value=value, provenance=self.extend_provenance(provenance))
                 self.log('output_queue.put', queue_el)
+                self.hand_off(value)
                 if self.deepcopy:
                     queue_el = deepcopy(queue_el)
-                self.output_queue.put(queue_el)
+                self.put_queue_el(queue_el, seq)
             self.log('tmp', None)
     
     def process_value(self, **kwargs):
         raise NotImplementedError
 
+    def process_control(self, queue_msg):
+        self.resolve(self.process_value(queue_msg))
+
+    def process_cached(self, x):
+        '''
+        process_value that returns the cached result if a value with the same content was processed before
+        '''
+        if self.cache is None:
+            return self.resolve(self.process_value(x))
+        key = self.cache.get_key(x)
+        found, value = self.cache.get(key)
+        if not found:
+            value = self.resolve(self.process_value(x))
+            self.cache.put(key, value)
+        return value
+
+    def process_expired_value(self, x):
+        '''
+        is called instead of process_value for QueueData that exceeded the latency budget of the block,
+        could return a cheap result, None drops the QueueData
+        '''
+        return None
+
+
+class BatchProcessor(Processor):
+    '''
+    waits for a QueueData, then collects more until max_batch_size are collected or max_wait_ms passed
+    and processes their values with a single process_batch call
+    process_batch returns a list with a value or None for every input value
+    QueueMsg are passed to process_value as soon as they are received
+    '''
+    def __init__(
+        self,
+        name,
+        msg_queue,
+        input_queue, output_queue, assembler_input_queue,
+        max_batch_size=8, max_wait_ms=5,
+        deepcopy=False
+    ):
+        Processor.__init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue, deepcopy=deepcopy)
+        assert max_batch_size > 0, self.subblock_name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+    def custom_run(self):
+        assert self.input_queue is not None, f'subblock {self.subblock_name} cannot be a source'
+        stopped = False
+        while not stopped:
+            batch = []
+            deadline = None
+            while len(batch) < self.max_batch_size:
+                if deadline is None:
+                    timeout = None
+                else:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                try:
+                    queue_el, seq = self.get_queue_el(timeout=timeout)
+                except queue.Empty:
+                    break
+                if queue_el is None:
+                    # the collected batch is processed before stopping
+                    stopped = True
+                    break
+                assert isinstance(queue_el, QueueEl), f'input queue el not recognized in subblock {self.subblock_name}'
+                if isinstance(queue_el, QueueData):
+                    batch.append((queue_el, seq))
+                    if deadline is None:
+                        deadline = time.perf_counter() + self.max_wait_ms / 1000
+                elif isinstance(queue_el, QueueMsg):
+                    self.resolve(self.process_value(queue_el))
+                else:
+                    raise Exception(f'contact developer, no code for {type(queue_el)} in subblock {self.subblock_name}')
+
+            expired = [self.is_expired(queue_el) for queue_el, _ in batch]
+            xs = [queue_el.value for (queue_el, _), v in zip(batch, expired) if not v]
+            input_fingerprint = self.get_fingerprint(xs)
+            values = self.resolve(self.process_batch(xs)) if len(xs) > 0 else []
+            self.check_fingerprint(xs, input_fingerprint, 'input batch')
+            assert len(values) == len(xs), self.subblock_name
+            values = iter(values)
+            values = [
+                self.resolve(self.process_expired_value(queue_el.value)) if v else next(values)
+                for (queue_el, _), v in zip(batch, expired)
+            ]
+            for (queue_el, seq), value in zip(batch, values):
+                if self.output_queue is None:
+                    self.log('output_queue.put', queue_el)
+                    self.add_latency(queue_el.provenance)
+                elif value is None:
+                    if self.drop_queue is not None:
+                        self.drop_queue.put(QueueMsg(msg=(RESULT_DROPPED, queue_el.index)))
+                    if seq is not None:
+                        self.put_queue_el(None, seq)
+                else:
+                    queue_el = QueueData(
+                        name=self.name, index=queue_el.index, value=value,
+                        provenance=self.extend_provenance(queue_el.provenance)
+                    )
+                    self.log('output_queue.put', queue_el)
+                    self.hand_off(value)
+                    if self.deepcopy:
+                        queue_el = deepcopy(queue_el)
+                    self.put_queue_el(queue_el, seq)
+            self.log('tmp', None)
+
+    def process_value(self, x):
+        if isinstance(x, QueueMsg):
+            return None
+        else:
+            return self.resolve(self.process_batch([x]))[0]
+
+    def process_batch(self, xs):
+        raise NotImplementedError
+
 
 class Dissembler(SubBlock):
     def __init__(self, name, msg_queue, input_queue, output_queues):
@@ -210,21 +646,24 @@ class Dissembler(SubBlock):
     def custom_run(self):
         while True:
             self.log('queue_wait', None)
-            queue_el = self.input_queue.get()
+            queue_el = self.get_input()
             self.log('input_queue.get', queue_el)
             if queue_el is None:
                 break
             assert isinstance(queue_el, QueueEl), f'input queue el not recognized in subblock {self.subblock_name}'
             if isinstance(queue_el, QueueData):
-                output_queue_els = self.process_queue_el(queue_el)
+                output_queue_els = self.resolve(self.process_queue_el(queue_el))
                 self.log('output_queue.put', queue_el)
                 assert len(output_queue_els) == len(self.output_queues)
                 for output_queue, output_queue_el in zip(self.output_queues, output_queue_els):
                     if output_queue_el is not None:
-                        output_queue.put(output_queue_el)    
+                        if output_queue_el.provenance is None:
+                            output_queue_el.provenance = queue_el.provenance
+                        self.hand_off(output_queue_el.value)
+                        output_queue.put(output_queue_el)
                 self.log('tmp', None)
             elif isinstance(queue_el, QueueMsg):
-                self.process_queue_el(queue_el)
+                self.resolve(self.process_queue_el(queue_el))
                 continue
             else:
                 raise Exception(f'contact developer, no code for {type(queue_el)} in subblock {self.subblock_name}')
@@ -232,6 +671,56 @@ class Dissembler(SubBlock):
     def process_queue_el(self, **kwargs):
         raise NotImplementedError
 
+    def process_control(self, queue_msg):
+        self.resolve(self.process_queue_el(queue_msg))
+
+
+class Reorderer(SubBlock):
+    '''
+    merges outputs of processor replicas back into the order in which the replicas took their inputs
+    at most max_pending outputs wait for a missing one, after that the gap is skipped and the late output is dropped
+    '''
+    def __init__(self, name, msg_queue, input_queue, output_queue, max_pending=16):
+        SubBlock.__init__(self, name, msg_queue, input_queue=input_queue, output_queue=output_queue)
+        assert max_pending > 0
+        self.max_pending = max_pending
+        self.pending = dict()
+        self.next_seq = 0
+        # result queue of the pipeline if the block is between the input block and a result block, set by Pipeline
+        self.drop_queue = None
+
+    def custom_run(self):
+        while True:
+            self.log('queue_wait', None)
+            queue_el = self.input_queue.get()
+            self.log('input_queue.get', queue_el.el if isinstance(queue_el, QueueSeq) else queue_el)
+            if queue_el is None:
+                break
+            if isinstance(queue_el, QueueMsg):
+                continue
+            assert isinstance(queue_el, QueueSeq), f'input queue el not recognized in subblock {self.subblock_name}'
+            if queue_el.seq < self.next_seq:
+                # the gap was skipped
+                if queue_el.el is not None:
+                    self.count_dropped()
+                    if self.drop_queue is not None:
+                        self.drop_queue.put(QueueMsg(msg=(RESULT_DROPPED, queue_el.el.index)))
+                continue
+            self.pending[queue_el.seq] = queue_el.el
+            if len(self.pending) > self.max_pending:
+                self.next_seq = min(self.pending)
+            while self.next_seq in self.pending:
+                output_queue_el = self.pending.pop(self.next_seq)
+                self.next_seq += 1
+                if output_queue_el is not None:
+                    self.log('output_queue.put', output_queue_el)
+                    if isinstance(self.output_queue, list):
+                        for output_queue in self.output_queue:
+                            output_queue.put(output_queue_el)
+                    else:
+                        self.output_queue.put(output_queue_el)
+            self.log('tmp', None)
+
 
 class SkipAssembler(Assembler):
     def __init__(self, name, msg_queue, input_queue, output_queue):
@@ -249,11 +738,12 @@ class SkipAssembler(Assembler):
                     self.max_index = els[i].index
                     max_index_index = i
             elif isinstance(els[i], QueueMsg):
-                self.process_value(els[i])
+                self.resolve(self.process_value(els[i]))
             else:
                 raise Exception(f'contact developer, no code for {type(els[i])} in subblock {self.subblock_name}')
+        self.count_dropped(sum(isinstance(el, QueueData) for el in els) - int(max_index_index >= 0))
         if max_index_index >= 0:
-            value = deepcopy(self.process_value(els[max_index_index].value))
+            value = self.resolve(self.process_value(els[max_index_index].value))
             return [QueueData(name=self.name, index=self.max_index, value=value)]
         else:
             return []
@@ -281,6 +771,80 @@ class NoSkipAssembler(Assembler):
         return result
 
 
+class WindowAssembler(Assembler):
+    '''
+    emits the last window_size values every stride values, the output index is the index of the last value
+    values are written twice into a preallocated ring of capacity slots, to slot i and slot i + capacity,
+    so the last window_size values are always a contiguous slice and windows are emitted without copying
+    stack=True - values are ndarrays of the same shape and dtype, windows are ndarray views of shape (window_size, *shape)
+    stack=False - windows are lists of values
+    a view stays valid for capacity - window_size following values, capacity is 2 * window_size by default
+    views are put without copying only into queues that pickle them during put (copies_on_put: RingQueue, Mailbox),
+    other queues pickle later in a feeder thread or pass them by reference, so windows are copied, as with debug_payloads
+    process_value could transform every value before it is stored
+    '''
+    def __init__(self, name, msg_queue, input_queue, output_queue, window_size, stride=1, stack=False, capacity=None):
+        Assembler.__init__(self, name, msg_queue, input_queue, output_queue)
+        assert window_size > 0 and stride > 0, self.subblock_name
+        self.window_size = window_size
+        self.stride = stride
+        self.stack = stack
+        self.capacity = 2 * window_size if capacity is None else capacity
+        assert self.capacity >= window_size, self.subblock_name
+        # is allocated on the first value if stack
+        self.ring = None if stack else [None] * (2 * self.capacity)
+        self.n_values = 0
+
+    def write(self, value):
+        i = self.n_values % self.capacity
+        if self.stack:
+            value = np.asarray(value)
+            if self.ring is None:
+                self.ring = np.empty((2 * self.capacity,) + value.shape, dtype=value.dtype)
+            assert value.shape == self.ring.shape[1:], f'{value.shape} != {self.ring.shape[1:]} in subblock {self.subblock_name}'
+            self.ring[i] = value
+            self.ring[i + self.capacity] = value
+        else:
+            self.ring[i] = value
+            self.ring[i + self.capacity] = value
+        self.n_values += 1
+
+    def get_window(self, copy_window=False):
+        end = (self.n_values - 1) % self.capacity + self.capacity + 1
+        window = self.ring[end - self.window_size:end]
+        return window.copy() if copy_window else window
+
+    def process_queue_els(self, els):
+        # the ring could overwrite a view before the output queue has taken its data
+        copy_window = self.stack and (self.debug_payloads or not getattr(self.output_queue, 'copies_on_put', False))
+        windows = []
+        for el in els:
+            if isinstance(el, QueueData):
+                value = self.resolve(self.process_value(el.value))
+                if value is None:
+                    continue
+                self.write(value)
+                if self.n_values >= self.window_size and (self.n_values - self.window_size) % self.stride == 0:
+                    windows.append((self.n_values, QueueData(name=self.name, index=el.index, value=self.get_window(copy_window))))
+            elif isinstance(el, QueueMsg):
+                self.resolve(self.process_value(el))
+            else:
+                raise Exception(f'contact developer, no code for {type(el)} in subblock {self.subblock_name}')
+        # windows are put after all els are written, overwritten views are dropped, lists and copies stay valid
+        result = [
+            el for n_values, el in windows
+            if not self.stack or copy_window or self.n_values - n_values <= self.capacity - self.window_size
+        ]
+        self.count_dropped(len(windows) - len(result))
+        return result
+
+    def process_value(self, x):
+        if isinstance(x, QueueMsg):
+            return None
+        else:
+            return x
+
+
 class DummySkipAssembler(SkipAssembler):
     def __init__(self, name, msg_queue, input_queue, output_queue):
         SkipAssembler.__init__(self, name, msg_queue, input_queue, output_queue)
@@ -295,37 +859,91 @@ class DummySkipAssembler(SkipAssembler):
 class DummyMultipleSkipAssembler(Assembler):
     def __init__(self, name, msg_queue, input_queue, output_queue, input_names):
         Assembler.__init__(self, name, msg_queue, input_queue, output_queue)
-        self.inputs = dict()        
         self.input_names = input_names
+        self.index_join = IndexJoin(input_names)
         self.max_index = 0
         
     def process_queue_els(self, els):
         if len(els) == 0:
             return []
+        n_dropped = self.index_join.n_dropped
         for el in els:
             if isinstance(el, QueueData):
-                if el.name in self.input_names:
-                    index = el.index
-                    if not index in self.inputs:
-                        self.inputs[index] = dict()
-                    self.inputs[index][el.name] = el.value
+                if el.name in self.index_join.input_names:
+                    self.index_join.add(el.name, el.index, el.value)
                 else:
                     raise Exception(f'subblock: {self.subblock_name}, el: {str(el)}')
         result = []
-        indexes = list(sorted(filter(lambda k: len(self.inputs[k]) == len(self.input_names), self.inputs.keys())))
-        if len(indexes) > 0:
-            max_index = max(indexes)
-            self.max_index = max(self.max_index, max_index)
-            if max_index == self.max_index:
-                result_value = deepcopy(self.inputs[max_index])
-                result_queue_el = QueueData(name=self.name, index=max_index, value=result_value)
-                result.append(result_queue_el)
-            delete_indexes = list(filter(lambda x: x <= self.max_index, self.inputs.keys()))
-            for delete_index in delete_indexes:
-                del self.inputs[delete_index]
+        joined = self.index_join.pop_latest()
+        if joined is not None:
+            index, value = joined
+            self.max_index = max(self.max_index, index)
+            result.append(QueueData(name=self.name, index=index, value=value))
+        self.count_dropped(self.index_join.n_dropped - n_dropped)
         return result
 
 
+class ReplayProcessor(Processor):
+    '''
+    source that streams QueueData recorded by Pipeline.set_capture, values are read-only zero-copy views of the capture file
+    mode original - with recorded time intervals, fixed - at fps, fast - as fast as outputs take them
+    replay_loop=True starts over after the last record, indexes continue after the last replayed one
+    '''
+    def __init__(
+        self,
+        name,
+        msg_queue,
+        input_queue, output_queue, assembler_input_queue,
+        capture_fp, mode='original', fps=None, replay_loop=False
+    ):
+        Processor.__init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue)
+        assert mode in REPLAY_MODES, mode
+        assert mode != 'fixed' or (fps is not None and fps > 0), f'fixed mode of subblock {self.subblock_name} requires fps'
+        self.replay_fp = capture_fp
+        self.mode = mode
+        self.fps = fps
+        self.replay_loop = replay_loop
+        # is opened in the subblock process
+        self.reader = None
+        self.i = 0
+        self.n_replayed = 0
+        self.index_offset = 0
+        self.last_index = None
+        self.start_time = None
+
+    def get_target_time(self):
+        if self.mode == 'original':
+            return self.start_time + (self.reader.get_time_ns(self.i) - self.reader.get_time_ns(0)) * 1e-9
+        elif self.mode == 'fixed':
+            return self.start_time + self.n_replayed / self.fps
+        return None
+
+    def process_value(self, x=None):
+        if isinstance(x, QueueMsg):
+            return None
+        if self.reader is None:
+            self.reader = CaptureReader(self.replay_fp)
+            assert len(self.reader) > 0, f'capture {self.replay_fp} of subblock {self.subblock_name} is empty'
+        if self.i == len(self.reader):
+            if not self.replay_loop:
+                time.sleep(self.demand_timeout)
+                return None
+            self.i = 0
+            self.n_replayed = 0
+            self.index_offset = self.last_index + 1 - self.reader.read(0)[1]
+            self.start_time = None
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        target_time = self.get_target_time()
+        if target_time is not None:
+            time.sleep(max(target_time - time.perf_counter(), 0))
+        _, index, _, value = self.reader.read(self.i)
+        self.i += 1
+        self.n_replayed += 1
+        self.last_index = index + self.index_offset
+        return self.last_index, value
+
+
 class DummyProcessor(Processor):
     def __init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue):
         Processor.__init__(self, name, msg_queue, input_queue, output_queue, assembler_input_queue)
@@ -345,4 +963,5 @@ class DummyDissembler(Dissembler):
         if isinstance(x, QueueMsg):
             return None
         else:
-            return [deepcopy(x) for _ in range(len(self.output_queues))]
+            # QueueData are copied, their values are shared
+            return [copy(x) for _ in range(len(self.output_queues))]
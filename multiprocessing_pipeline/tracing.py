@@ -0,0 +1,76 @@
+import mmap
+import struct
+import time
+
+import numpy as np
+
+
+TRACE_MAGIC = b'MPTRACE1'
+# magic, capacity, position, perf_counter_ns and time_ns at creation
+HEADER_FORMAT = '<8sQQqq'
+HEADER_SIZE = 64
+POSITION_OFFSET = 16
+RECORD_FORMAT = '<qqii'
+RECORD_DTYPE = np.dtype([('time', '<i8'), ('index', '<i8'), ('event', '<i4'), ('kind', '<i4')])
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+assert RECORD_SIZE == RECORD_DTYPE.itemsize
+
+# events are messages of SubBlock.log
+EVENTS = ['set_logger', 'queue_wait', 'input_queue.get', 'output_queue.put', 'tmp']
+EVENT_CODES = {k: i for i, k in enumerate(EVENTS)}
+# kinds of logged data
+KIND_NONE = 0
+KIND_DATA = 1
+KIND_MSG = 2
+
+
+class Tracer:
+    '''
+    writes fixed size records (perf_counter_ns, QueueData.index, event code, data kind)
+    to a memory-mapped ring buffer file of capacity records, the oldest records are overwritten
+    '''
+    def __init__(self, fp, capacity=1 << 20):
+        self.fp = fp
+        self.capacity = capacity
+        with open(fp, 'wb') as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD_SIZE)
+        self.f = open(fp, 'r+b')
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        struct.pack_into(HEADER_FORMAT, self.mm, 0, TRACE_MAGIC, capacity, 0, time.perf_counter_ns(), time.time_ns())
+        self.position = 0
+
+    def record(self, msg, data):
+        if data is None:
+            index, kind = -1, KIND_NONE
+        elif hasattr(data, 'index'):
+            index, kind = data.index, KIND_DATA
+        else:
+            index, kind = -1, KIND_MSG
+        struct.pack_into(
+            RECORD_FORMAT, self.mm, HEADER_SIZE + (self.position % self.capacity) * RECORD_SIZE,
+            time.perf_counter_ns(), index, EVENT_CODES.get(msg, -1), kind
+        )
+        self.position += 1
+        struct.pack_into('<Q', self.mm, POSITION_OFFSET, self.position)
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.f.close()
+
+
+def read_trace(fp):
+    '''
+    returns records in chronological order and offset in ns to convert their perf_counter_ns time to time_ns
+    '''
+    with open(fp, 'rb') as f:
+        data = f.read()
+    magic, capacity, position, perf_counter_ns, time_ns = struct.unpack_from(HEADER_FORMAT, data, 0)
+    assert magic == TRACE_MAGIC, fp
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=capacity, offset=HEADER_SIZE)
+    if position <= capacity:
+        records = records[:position]
+    else:
+        start = position % capacity
+        records = np.concatenate([records[start:], records[:start]])
+    return records, time_ns - perf_counter_ns
@@ -1,22 +1,156 @@
 import argparse
 import os
 from os.path import join
-import matplotlib.pyplot as plt
-import datetime
 from collections import defaultdict
 import numpy as np
 
+from multiprocessing_pipeline.tracing import EVENTS, EVENT_CODES, KIND_NONE, KIND_DATA, KIND_MSG, read_trace
+from multiprocessing_pipeline.log_report import get_report, print_report
+
+
+LOG_EXTS = ('.log', '.trace')
+CACHE_DIRNAME = '.cache'
+# lines are '%(asctime)s.%(msecs)03d -- %(levelname)s -- %(message)s', see SubBlock.set_logger
+DATE_SIZE = 23
+LEVEL_BYTES = b' -- INFO -- '
+MSG_START = DATE_SIZE + len(LEVEL_BYTES)
+# longer lines are truncated, they are only QueueMsg
+MAX_LINE_SIZE = 128
+INDEX_BYTES = b'QueueData.index='
+MAX_INDEX_SIZE = 20
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--log_dirpath', required=True)
     parser.add_argument('--fps', action='store_true')
+    parser.add_argument('--no_cache', action='store_true')
+    parser.add_argument('--report', action='store_true', help='utilization, queueing delay and critical path')
+    parser.add_argument('--target_fps', type=float, default=None, help='suggest replicas to reach fps in report')
     args = parser.parse_args()
     return args
 
 
+def match_bytes(m, start, pattern):
+    '''
+    rows of uint8 matrix m with pattern at columns start or start[row]
+    '''
+    pattern = np.frombuffer(pattern, dtype=np.uint8)
+    if np.isscalar(start):
+        return (m[:, start:start + len(pattern)] == pattern).all(axis=1)
+    cols = np.minimum(start[:, None] + np.arange(len(pattern)), m.shape[1] - 1)
+    return (np.take_along_axis(m, cols, axis=1) == pattern).all(axis=1)
+
+
+def parse_log(fp):
+    '''
+    returns time in ns, event code, QueueData.index and data kind arrays of a text log, see tracing.Tracer
+    lines are parsed at once as rows of a uint8 matrix
+    '''
+    with open(fp, 'rb') as f:
+        lines = np.array(f.read().split(b'\n'), dtype=f'S{MAX_LINE_SIZE}')
+    m = lines.view(np.uint8).reshape(len(lines), MAX_LINE_SIZE)
+    m = m[match_bytes(m, DATE_SIZE, LEVEL_BYTES)]
+    n = len(m)
+
+    event = np.full(n, -1, dtype=np.int32)
+    value_start = np.full(n, m.shape[1] - 1)
+    for code, msg in enumerate(EVENTS):
+        end = MSG_START + len(msg)
+        mask = match_bytes(m, MSG_START, msg.encode()) & ((m[:, end] == ord(' ')) | (m[:, end] == 0))
+        event[mask] = code
+        value_start[mask] = end + 1
+
+    kind = np.full(n, KIND_MSG, dtype=np.int32)
+    kind[(m[np.arange(n), value_start] == 0) | match_bytes(m, value_start, b'None\0')] = KIND_NONE
+    has_index = match_bytes(m, value_start, INDEX_BYTES)
+    kind[has_index] = KIND_DATA
+
+    index = np.full(n, -1, dtype=np.int64)
+    cols = np.minimum(value_start[has_index, None] + len(INDEX_BYTES) + np.arange(MAX_INDEX_SIZE), m.shape[1] - 1)
+    chars = np.take_along_axis(m[has_index], cols, axis=1).astype(np.int64)
+    negative = chars[:, 0] == ord('-')
+    chars[negative] = np.roll(chars[negative], -1, axis=1)
+    digits = chars - ord('0')
+    n_digits = np.cumprod((digits >= 0) & (digits <= 9), axis=1).sum(axis=1)
+    powers = n_digits[:, None] - 1 - np.arange(MAX_INDEX_SIZE)
+    values = np.where(powers >= 0, digits * 10 ** np.maximum(powers, 0), 0).sum(axis=1)
+    index[has_index] = np.where(negative, -values, values)
+
+    dates = np.ascontiguousarray(m[:, :DATE_SIZE]).view(f'S{DATE_SIZE}').ravel()
+    return {
+        'time': dates.astype('datetime64[ms]').astype('datetime64[ns]').view(np.int64),
+        'event': event,
+        'index': index,
+        'kind': kind
+    }
+
+
+def parse_trace(fp):
+    records, offset = read_trace(fp)
+    return {
+        'time': records['time'] + offset,
+        'event': records['event'].copy(),
+        'index': records['index'].copy(),
+        'kind': records['kind'].copy()
+    }
+
+
+def load_log(log_dirpath, fn, use_cache=True):
+    '''
+    parses a .log or .trace file once, parsed arrays are cached in a .npz file of log_dirpath/.cache
+    '''
+    fp = join(log_dirpath, fn)
+    stat = os.stat(fp)
+    cache_fp = join(log_dirpath, CACHE_DIRNAME, f'{fn}.npz')
+    if use_cache and os.path.exists(cache_fp):
+        with np.load(cache_fp) as cached:
+            if cached['source_mtime_ns'] == stat.st_mtime_ns and cached['source_size'] == stat.st_size:
+                return {k: cached[k] for k in ['time', 'event', 'index', 'kind']}
+    if fn.endswith('.trace'):
+        result = parse_trace(fp)
+    else:
+        result = parse_log(fp)
+    if use_cache:
+        os.makedirs(join(log_dirpath, CACHE_DIRNAME), exist_ok=True)
+        np.savez(cache_fp, source_mtime_ns=stat.st_mtime_ns, source_size=stat.st_size, **result)
+    return result
+
+
+def load_logs(log_dirpath, use_cache=True):
+    '''
+    returns {(block_i, block_j, block_name, subblock_type): parsed arrays}
+    '''
+    result = dict()
+    for fn in sorted(os.listdir(log_dirpath)):
+        name, ext = os.path.splitext(fn)
+        if ext not in LOG_EXTS:
+            continue
+        ij, block_name, subblock_type = name.split(' ')
+        block_i, block_j = list(map(int, ij.split('_')))
+        result[(block_i, block_j, block_name, subblock_type)] = load_log(log_dirpath, fn, use_cache=use_cache)
+    return result
+
+
+def get_processor_times(log):
+    '''
+    returns start2output and output2output times in seconds,
+    start2output is time from input_queue.get to the first output_queue.put after it
+    '''
+    time = log['time'] * 1e-9
+    get_positions = np.flatnonzero(log['event'] == EVENT_CODES['input_queue.get'])
+    put_positions = np.flatnonzero(log['event'] == EVENT_CODES['output_queue.put'])
+    output2output = np.diff(time[put_positions])
+    # last get before each put, it should be after the previous put
+    k = np.searchsorted(get_positions, put_positions) - 1
+    prev_put_positions = np.concatenate([[-1], put_positions[:-1]])
+    mask = k >= 0
+    mask[mask] = get_positions[k[mask]] > prev_put_positions[mask]
+    start2output = time[put_positions[mask]] - time[get_positions[k[mask]]]
+    return start2output, output2output
+
+
 def main():
-    data_s = 'QueueData.index='
     msg_msg2c = dict({
         'queue_wait': 'y',
         'tmp': 'k',
@@ -25,182 +159,98 @@ def main():
     })
     msg_msg2c_order = ['y', 'k', 'r', 'g']
     c2ddy = {
-        'y': -0.375, 
-        'r': -0.125, 
-        'g': 0.125, 
+        'y': -0.375,
+        'r': -0.125,
+        'g': 0.125,
         'k': 0.375
     }
     assert set(msg_msg2c_order) <= set(msg_msg2c.values())
+    assert set(msg_msg2c) <= set(EVENTS)
+    c2event = {c: EVENT_CODES[k] for k, c in msg_msg2c.items()}
     subblock_type2c = dict({
         'assembler': 'r',
         'processor': 'b',
         'dissembler': 'g'
     })
 
-    blocks = defaultdict(list)
-
     args = parse_args()
-    logs_dirpath = args.log_dirpath
+    logs = load_logs(args.log_dirpath, use_cache=not args.no_cache)
     fy = 2
     dy = 0.2
     ddy = 0.3
 
-    min_time = None
-    max_time = None
-    max_block_i = 0
-    for fn in os.listdir(logs_dirpath):
-        with open(join(logs_dirpath, fn), 'r') as f:
-            data = f.readlines()
-        fn = os.path.splitext(fn)[0]
-        ij, block_name, subblock_type = fn.split(' ')
-        block_i, block_j = list(map(int, ij.split('_')))
-        y_name = f''
-        max_block_i = max(max_block_i, block_i)
-        blocks[block_name].append(subblock_type)
-        for line in data:
-            line = line.strip()
-            if len(line) == 0:
-                continue
-            line = line.split(' -- ')
-            try:
-                date, log_level, msg = line
-            except:
-                continue
-            if log_level != 'INFO':
-                continue
-            date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
-            if min_time is None or date < min_time:
-                min_time = date
-            if max_time is None or date > max_time:
-                max_time = date
+    blocks = defaultdict(list)
+    for block_i, block_j, block_name, subblock_type in logs:
+        # processor replicas are named block_name.r
+        blocks[block_name.split('.')[0]].append(subblock_type)
+    max_block_i = max([k[0] for k in logs], default=0)
+    non_empty = [v['time'] for v in logs.values() if len(v['time']) > 0]
+    if len(non_empty) == 0:
+        raise Exception(f'no log records in {args.log_dirpath}')
+    min_time = min(v.min() for v in non_empty)
+    max_time = max(v.max() for v in non_empty)
+
+    if args.report:
+        report = get_report(args.log_dirpath, logs, target_fps=args.target_fps)
+        print_report(report, target_fps=args.target_fps)
+        return
 
     if args.fps:
         from prettytable import PrettyTable
         pt = PrettyTable(['name', 'mean ms', 'mean fps', 'median ms', 'median fps'])
-        for fn in sorted(os.listdir(logs_dirpath)):
-            with open(join(logs_dirpath, fn), 'r') as f:
-                data = f.readlines()
-            fn = os.path.splitext(fn)[0]
-            ij, block_name, subblock_type = fn.split(' ')
-            block_i, block_j = list(map(int, ij.split('_')))
-            y = fy * (block_i + dy * block_j)
-            if subblock_type == 'processor':
-                times = []
-                times_prev = []
-                prev = None
-                start = None
-                for line in data:
-                    line = line.strip()
-                    line = line.split(' -- ')
-                    try:
-                        date, log_level, msg = line
-                    except:
-                        continue
-                    if log_level != 'INFO':
-                        continue
-                    date, log_level, msg = line
-                    date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
-                    date = (date - min_time).total_seconds()
-
-                    try:
-                        msg_msg, msg_value = msg.split(' ')
-                    except:
-                        continue
-
-                    if msg_msg in msg_msg2c:
-                        c = msg_msg2c[msg_msg]
-                        if c == 'r':
-                            start = date
-                        if c == 'g':
-                            if prev is not None:
-                                times_prev.append(date - prev)
-                            prev = date
-                            if start is not None:
-                                times.append(date - start)
-                                start = None
-
-                for cur_times, timing_name in zip((times, times_prev), ['start2output', 'output2output']):
-                    cur_times = cur_times[-200:]
-                    if len(cur_times) > 10:
-                        cur_times = cur_times[10:]
-                        pt.add_row([
-                            f'{block_i} {block_name} {subblock_type} {timing_name}',
-                            f'{np.mean(cur_times) * 1000:.2f}',
-                            f'{1 / np.mean(cur_times):.2f}',
-                            f'{np.median(cur_times) * 1000:.2f}',
-                            f'{1 / np.median(cur_times):.2f}'
-                        ])
+        for (block_i, block_j, block_name, subblock_type), log in logs.items():
+            if subblock_type != 'processor':
+                continue
+            for cur_times, timing_name in zip(get_processor_times(log), ['start2output', 'output2output']):
+                cur_times = cur_times[-200:]
+                if len(cur_times) > 10:
+                    cur_times = cur_times[10:]
+                    pt.add_row([
+                        f'{block_i} {block_name} {subblock_type} {timing_name}',
+                        f'{np.mean(cur_times) * 1000:.2f}',
+                        f'{1 / np.mean(cur_times):.2f}',
+                        f'{np.median(cur_times) * 1000:.2f}',
+                        f'{1 / np.median(cur_times):.2f}'
+                    ])
         print(pt)
         return
 
-    duration = (max_time - min_time).total_seconds()
+    import matplotlib.pyplot as plt
+    duration = (max_time - min_time) * 1e-9
     fig, ax = plt.subplots(1, 1, figsize=(duration, fy * max_block_i))
     yticks = []
     ytick_names = []
-    for fn in os.listdir(logs_dirpath):
-        with open(join(logs_dirpath, fn), 'r') as f:
-            data = f.readlines()
-        fn = os.path.splitext(fn)[0]
-        ij, block_name, subblock_type = fn.split(' ')
-        block_i, block_j = list(map(int, ij.split('_')))
+    for (block_i, block_j, block_name, subblock_type), log in logs.items():
         y = fy * (block_i + dy * block_j)
         yticks.append(y)
         ytick_names.append(f'{block_name} {subblock_type}')
-        cur_min_time = None
-        xs = []
-        cs = []
-        ys = []
-        for line in data:
-            line = line.strip()
-            line = line.split(' -- ')
-            try:
-                date, log_level, msg = line
-            except:
-                continue
-            if log_level != 'INFO':
-                continue
-            date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
-            date = (date - min_time).total_seconds()
-            if cur_min_time is None:
-                cur_min_time = date
-            cur_max_time = date
-            try:
-                msg_msg, msg_value = msg.split(' ')
-            except:
-                continue
-            if msg_value.startswith(data_s) or msg_value == 'None':
-                if msg_msg in msg_msg2c:
-                    xs.append(date)
-                    cs.append(msg_msg2c[msg_msg])
-                    y_text = None
-                    ys.append(y + fy * dy * ddy * c2ddy[msg_msg2c[msg_msg]])
-                    if msg_msg2c[msg_msg] == 'g':
-                        if (subblock_type == 'assembler') or \
-                                (subblock_type == 'processor' and 'assembler' not in blocks[block_name]):
-                            y_text = y - 0.5 * fy * dy
-                        if (subblock_type == 'processor' and 'dissembler' not in blocks[block_name]) or \
-                                (subblock_type == 'dissembler'):
-                            y_text = y + 0.5 * fy * dy
-                    if y_text is not None:
-                        msg_index = int(msg_value[len(data_s):])
-                        # print(msg_index, block_name, subblock_type)
-                        ax.text(
-                            date, y_text, str(msg_index), 
-                            fontsize=8, 
-                            verticalalignment='center', 
-                            horizontalalignment='center',
-                            rotation=90
-                        )
-        ax.plot([cur_min_time, cur_max_time], [y, y], f'{subblock_type2c[subblock_type]}--')
+        if len(log['time']) == 0:
+            continue
+        xs = (log['time'] - min_time) * 1e-9
+        ax.plot([xs[0], xs[-1]], [y, y], f'{subblock_type2c[subblock_type]}--')
+        not_msg = log['kind'] != KIND_MSG
         for c in msg_msg2c_order:
-            sub_xs = []
-            sub_ys = []
-            for i in range(len(cs)):
-                if cs[i] == c:
-                    sub_xs.append(xs[i])
-                    sub_ys.append(ys[i])
-            ax.scatter(sub_xs, sub_ys, c=c, s=20)
-    # return
+            mask = not_msg & (log['event'] == c2event[c])
+            ax.scatter(xs[mask], np.full(mask.sum(), y + fy * dy * ddy * c2ddy[c]), c=c, s=20)
+
+        block_subblocks = blocks[block_name.split('.')[0]]
+        y_text = None
+        if (subblock_type == 'assembler') or \
+                (subblock_type == 'processor' and 'assembler' not in block_subblocks):
+            y_text = y - 0.5 * fy * dy
+        if (subblock_type == 'processor' and 'dissembler' not in block_subblocks) or \
+                (subblock_type == 'dissembler'):
+            y_text = y + 0.5 * fy * dy
+        if y_text is not None:
+            mask = (log['kind'] == KIND_DATA) & (log['event'] == c2event['g'])
+            for x, msg_index in zip(xs[mask], log['index'][mask]):
+                ax.text(
+                    x, y_text, str(msg_index),
+                    fontsize=8,
+                    verticalalignment='center',
+                    horizontalalignment='center',
+                    rotation=90
+                )
     ax.yaxis.set_ticks(yticks)
     ax.set_yticklabels(ytick_names)
     plt.show()
@@ -0,0 +1,18 @@
+import queue
+import threading
+
+from multiprocessing_pipeline import NoSkipAssembler, QueueData, QueueMsg
+from multiprocessing_pipeline.subblocks import PROCESSOR_FED
+
+
+def test_data_collected_while_processor_is_busy_is_flushed_on_processor_fed():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    assembler = NoSkipAssembler('a', None, input_queue, output_queue)
+    threading.Thread(target=assembler.custom_run, daemon=True).start()
+    input_queue.put(QueueData(name='src', index=0, value=0))
+    assert output_queue.get(timeout=1).index == 0
+    # the processor is busy with 0
+    input_queue.put(QueueData(name='src', index=1, value=1))
+    input_queue.put(QueueData(name='src', index=2, value=2))
+    input_queue.put(QueueMsg(msg=PROCESSOR_FED))
+    assert [output_queue.get(timeout=1).index for _ in range(2)] == [1, 2]
@@ -0,0 +1,78 @@
+import queue
+
+import pytest
+
+from multiprocessing_pipeline import BoundedQueue, QueueData, QueueMsg
+
+
+def put_range(q, name, n):
+    for i in range(n):
+        q.put(QueueData(name=name, index=i, value=i), timeout=0.01)
+
+
+def get_all(q):
+    result = []
+    while True:
+        try:
+            el = q.get(timeout=0.1)
+        except queue.Empty:
+            return result
+        result.append((el.name, el.index) if isinstance(el, QueueData) else el.msg)
+
+
+def test_limits_are_per_producer():
+    q = BoundedQueue({'a': (2, 'drop_oldest'), 'b': (3, 'drop_oldest')})
+    put_range(q, 'a', 10)
+    put_range(q, 'b', 10)
+    assert q.qsize() == 5
+    assert q.dropped() == {'a': 8, 'b': 7}
+    assert sorted(get_all(q)) == [('a', 8), ('a', 9), ('b', 7), ('b', 8), ('b', 9)]
+
+
+def test_drops_happen_at_put():
+    q = BoundedQueue({'a': (2, 'drop_oldest')})
+    put_range(q, 'a', 100)
+    # dropped QueueData do not stay in the sub-queue until get
+    assert q.n_queued['a'].value == 2
+    assert q.dropped() == {'a': 98}
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('drop_oldest', [8, 9]),
+    ('drop_newest', [0, 1]),
+    ('latest', [9]),
+])
+def test_policies(policy, expected):
+    q = BoundedQueue({'a': (2, policy)})
+    put_range(q, 'a', 10)
+    assert [index for _, index in get_all(q)] == expected
+    assert q.dropped()['a'] == 10 - len(expected)
+
+
+def test_block_policy_raises_full():
+    q = BoundedQueue({'a': (2, 'block')})
+    put_range(q, 'a', 2)
+    with pytest.raises(queue.Full):
+        q.put(QueueData(name='a', index=2, value=2), timeout=0.01)
+    assert q.dropped() == {'a': 0}
+
+
+def test_unlimited_producers_and_msgs():
+    q = BoundedQueue({'a': (1, 'drop_oldest')})
+    put_range(q, 'a', 3)
+    put_range(q, 'other', 3)
+    q.put(QueueMsg(msg='m'))
+    result = get_all(q)
+    # QueueMsg are taken first, producers without limits are not bounded
+    assert result[0] == 'm'
+    assert sorted(result[1:]) == [('a', 2), ('other', 0), ('other', 1), ('other', 2)]
+
+
+def test_get_msg_leaves_data_queued():
+    q = BoundedQueue({'a': (2, 'block')})
+    put_range(q, 'a', 2)
+    with pytest.raises(queue.Empty):
+        q.get_msg(timeout=0.01)
+    q.put(QueueMsg(msg='m'))
+    assert q.get_msg(timeout=0.1).msg == 'm'
+    assert q.qsize() == 2
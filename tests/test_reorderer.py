@@ -0,0 +1,39 @@
+import queue
+
+from multiprocessing_pipeline import Reorderer, QueueData, QueueSeq
+from multiprocessing_pipeline.subblocks import RESULT_DROPPED
+
+
+def run_reorderer(seqs, max_pending=16):
+    '''
+    puts QueueSeq of seqs, None for an empty output, returns output indexes and reported drops
+    '''
+    input_queue, output_queue, drop_queue = queue.Queue(), queue.Queue(), queue.Queue()
+    reorderer = Reorderer('r', None, input_queue, output_queue, max_pending=max_pending)
+    reorderer.drop_queue = drop_queue
+    for seq, index in seqs:
+        el = None if index is None else QueueData(name='r', index=index, value=index)
+        input_queue.put(QueueSeq(seq=seq, el=el))
+    input_queue.put(None)
+    reorderer.custom_run()
+    outputs = [output_queue.get().index for _ in range(output_queue.qsize())]
+    drops = [drop_queue.get().msg for _ in range(drop_queue.qsize())]
+    return outputs, drops
+
+
+def test_orders_by_seq():
+    outputs, drops = run_reorderer([(2, 12), (0, 10), (3, 13), (1, 11)])
+    assert outputs == [10, 11, 12, 13]
+    assert drops == []
+
+
+def test_empty_outputs_fill_gaps():
+    outputs, drops = run_reorderer([(1, 11), (0, None), (2, 12)])
+    assert outputs == [11, 12]
+    assert drops == []
+
+
+def test_gap_is_skipped_and_late_output_is_reported():
+    outputs, drops = run_reorderer([(1, 11), (2, 12), (3, 13), (0, 10)], max_pending=2)
+    assert outputs == [11, 12, 13]
+    assert drops == [(RESULT_DROPPED, 10)]
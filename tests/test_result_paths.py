@@ -0,0 +1,104 @@
+import random
+import time
+
+import pytest
+
+from multiprocessing_pipeline import Block, Pipeline, Processor, BatchProcessor, QueueMsg
+from multiprocessing_pipeline import NoSkipAssembler, DummySkipAssembler, DummyProcessor
+
+
+class OddProcessor(Processor):
+    def process_value(self, x):
+        if isinstance(x, QueueMsg):
+            return None
+        return x if x % 2 else None
+
+
+class OddBatchProcessor(BatchProcessor):
+    def process_batch(self, xs):
+        return [x if x % 2 else None for x in xs]
+
+
+class JitterProcessor(Processor):
+    def process_value(self, x):
+        if isinstance(x, QueueMsg):
+            return None
+        time.sleep(random.random() * 0.01)
+        return x
+
+
+def build(set_work, replicas=1, **output_kwargs):
+    '''
+    in -> work -> out, set_work(p) sets subblocks of block work, out has replicas
+    '''
+    p = Pipeline()
+    p.add_block(Block('in', use_assembler=False, use_dissembler=False))
+    p.add_block(Block('work', use_dissembler=False))
+    p.add_block(Block('out', skip_assembler=True, use_dissembler=False))
+    p.set_outputs('in', ['work'], **output_kwargs)
+    p.set_outputs('work', ['out'])
+    p.check_connections()
+    p.create_queues()
+    p.set_input('in', max_in_flight=4)
+    set_work(p)
+    p.set_processor('out', JitterProcessor, replicas=replicas)
+    p.set_result('out')
+    return p
+
+
+def run_map(p, values):
+    p.start()
+    try:
+        return list(p.map(values, timeout=10))
+    finally:
+        p.terminate()
+
+
+@pytest.mark.parametrize('processor_class', [OddProcessor, OddBatchProcessor])
+def test_values_dropped_by_processors_give_no_result(processor_class):
+    def set_work(p):
+        p.set_assembler('work', NoSkipAssembler)
+        p.set_processor('work', processor_class)
+
+    assert run_map(build(set_work), range(20)) == list(range(1, 20, 2))
+
+
+def test_replicated_result_block():
+    def set_work(p):
+        p.set_assembler('work', NoSkipAssembler)
+        p.set_processor('work', DummyProcessor)
+
+    assert run_map(build(set_work, replicas=3), range(30)) == list(range(30))
+
+
+def test_outputs_dropped_by_reorderer_give_no_result():
+    def set_work(p):
+        p.set_assembler('work', NoSkipAssembler)
+        p.set_processor('work', JitterProcessor, replicas=3, max_pending=1)
+
+    results = run_map(build(set_work), range(40))
+    # late outputs of replicas could be dropped, map returns the rest in order
+    assert results == sorted(results)
+    assert set(results) <= set(range(40))
+
+
+def test_lossy_assembler_is_rejected():
+    def set_work(p):
+        p.set_assembler('work', DummySkipAssembler)
+        p.set_processor('work', DummyProcessor)
+
+    p = build(set_work)
+    with pytest.raises(Exception, match='drops values'):
+        p.start()
+    p.close()
+
+
+def test_dropping_output_policy_is_rejected():
+    def set_work(p):
+        p.set_assembler('work', NoSkipAssembler)
+        p.set_processor('work', DummyProcessor)
+
+    p = build(set_work, capacity=2, policy='drop_oldest')
+    with pytest.raises(Exception, match='drop_oldest'):
+        p.start()
+    p.close()
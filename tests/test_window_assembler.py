@@ -0,0 +1,50 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from multiprocessing_pipeline import WindowAssembler, RingQueue, QueueData
+
+
+def make_els(n, start=0):
+    return [QueueData(name='a', index=i, value=np.full(2, i)) for i in range(start, start + n)]
+
+
+def first_column(window):
+    return np.asarray(window)[:, 0].tolist()
+
+
+@pytest.mark.parametrize('stack', [False, True])
+def test_burst_gives_every_window(stack):
+    w = WindowAssembler('w', None, None, multiprocessing.Queue(), window_size=3, stack=stack)
+    result = w.process_queue_els(make_els(10))
+    assert [el.index for el in result] == list(range(2, 10))
+    assert [first_column(el.value) for el in result] == [[i, i + 1, i + 2] for i in range(8)]
+
+
+def test_stride():
+    w = WindowAssembler('w', None, None, multiprocessing.Queue(), window_size=2, stride=3)
+    result = w.process_queue_els(make_els(9))
+    assert [el.index for el in result] == [1, 4, 7]
+
+
+def test_stacked_windows_are_copied_for_queues_that_pickle_later():
+    w = WindowAssembler('w', None, None, multiprocessing.Queue(), window_size=3, stack=True)
+    result = w.process_queue_els(make_els(3))
+    w.process_queue_els(make_els(20, start=3))
+    assert not np.shares_memory(result[0].value, w.ring)
+    assert first_column(result[0].value) == [0, 1, 2]
+
+
+def test_stacked_windows_are_views_for_queues_that_copy_on_put():
+    q = RingQueue(1 << 16)
+    try:
+        w = WindowAssembler('w', None, None, q, window_size=3, stack=True)
+        result = w.process_queue_els(make_els(3))
+        assert np.shares_memory(result[0].value, w.ring)
+        # views overwritten within a batch are dropped, a view stays valid for capacity - window_size = 3 values
+        result = w.process_queue_els(make_els(10, start=3))
+        assert [el.index for el in result] == [9, 10, 11, 12]
+        assert [first_column(el.value) for el in result] == [[i - 2, i - 1, i] for i in range(9, 13)]
+    finally:
+        q.unlink()